@@ -0,0 +1,133 @@
+# backend/admission.py
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Optional, Tuple
+
+
+class RateLimiter:
+    """
+    Token buckets per (endpoint, client). Each limited path gets `rate`
+    tokens per second up to `burst`; a request spends one token. Only
+    touched from the event loop, so no locking.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], max_clients: int = 50000):
+        self.limits = limits
+        self.max_clients = max_clients
+        self.buckets: Dict[Tuple[str, str], list] = {}  # key -> [tokens, last refill]
+        self.rejected = 0
+
+    def check(self, path: str, client: str) -> float:
+        """0 if the request may proceed, otherwise seconds until a token is free."""
+        limit = self.limits.get(path)
+        if limit is None:
+            return 0.0
+        rate, burst = limit
+        now = time.monotonic()
+        key = (path, client)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_clients:
+                # Drop the oldest bucket (dicts keep insertion order)
+                self.buckets.pop(next(iter(self.buckets)))
+            bucket = self.buckets[key] = [burst, now]
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        self.rejected += 1
+        return (1 - tokens) / rate
+
+    def stats(self):
+        return {"clients": len(self.buckets), "rejected": self.rejected}
+
+
+class AdmissionControl:
+    """
+    Caps requests in flight. Excess requests wait for a slot, but only up to
+    max_queue_s; anything that would queue longer is shed immediately rather
+    than piling up behind the work that is already slow.
+    """
+
+    def __init__(self, max_concurrent: int = 64, max_queue_s: float = 0.5):
+        self.max_concurrent = max_concurrent
+        self.max_queue_s = max_queue_s
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.loop = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.shed = 0
+
+    async def acquire(self) -> bool:
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # Created lazily so it binds to the server's running loop
+            self.slots = asyncio.Semaphore(self.max_concurrent)
+            self.loop = loop
+            self.in_flight = 0
+        if self.slots.locked():
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.slots.acquire(), self.max_queue_s)
+            except asyncio.TimeoutError:
+                self.shed += 1
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self.slots.acquire()
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self.slots.release()
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue_s": self.max_queue_s,
+            "shed": self.shed,
+        }
+
+
+class PoolFull(Exception):
+    pass
+
+
+class BlockingPool:
+    """
+    Small thread pool for blocking client calls (Twilio REST). The backlog
+    is bounded too: once `max_workers + max_pending` calls are outstanding,
+    new ones fail fast with PoolFull instead of queueing without limit.
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 16, name: str = "blocking"):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.capacity = max_workers + max_pending
+        self.outstanding = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args, **kwargs):
+        if self.outstanding >= self.capacity:
+            self.rejected += 1
+            raise PoolFull(f"{self.outstanding} calls already outstanding")
+        self.outstanding += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+        finally:
+            self.outstanding -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def stats(self):
+        return {"outstanding": self.outstanding, "capacity": self.capacity, "rejected": self.rejected}
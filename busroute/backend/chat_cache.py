@@ -0,0 +1,80 @@
+# backend/chat_cache.py
+
+import json
+import threading
+from typing import Dict, Optional
+
+
+class ChatCache:
+    """
+    Prebuilt /ai_chat answers keyed by the normalized intent (bus_id, or None
+    when no bus number was found in the query). Values are the JSON-encoded
+    "response" string, so a hit is a dict lookup plus a byte join.
+
+    Answers are built outside any lock while the tick may be updating the
+    bus, so each key carries a version that invalidate() bumps: take
+    version() before building, and put() discards an answer that a tick
+    has invalidated in the meantime.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.entries: Dict[Optional[int], bytes] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+        self.epoch = 0  # bumped by clear()
+        self.versions: Dict[Optional[int], int] = {}
+        self.lock = threading.Lock()  # orders put() against invalidate()
+
+    def get(self, key: Optional[int]) -> Optional[bytes]:
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def version(self, key: Optional[int]):
+        return self.epoch, self.versions.get(key, 0)
+
+    def put(self, key: Optional[int], response: str, version) -> bytes:
+        """Encode the answer and cache it unless `key` changed since `version`."""
+        value = json.dumps(response).encode()
+        with self.lock:
+            if self.version(key) != version:
+                self.stale_puts += 1
+                return value
+            if len(self.entries) >= self.max_entries:
+                # Drop the oldest entry (dicts keep insertion order)
+                self.entries.pop(next(iter(self.entries)))
+            self.entries[key] = value
+        return value
+
+    def invalidate(self, key: Optional[int]):
+        with self.lock:
+            self.versions[key] = self.versions.get(key, 0) + 1
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.epoch += 1
+            self.versions.clear()
+            self.entries.clear()
+
+    @staticmethod
+    def render(query: str, cached: bytes) -> bytes:
+        return b'{"query":' + json.dumps(query).encode() + b',"response":' + cached + b"}"
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "stale_puts": self.stale_puts,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
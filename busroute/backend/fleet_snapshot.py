@@ -0,0 +1,183 @@
+# backend/fleet_snapshot.py
+
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+MAGIC = b"BRSN"
+VERSION = 1
+HEADER = struct.Struct("<4sHdI")  # magic, version, taken_at, bus count
+# bus_id, route_id, lat, lon, speed_kmph, next_stop_idx, eta_min, overcrowded, delayed, status length
+RECORD = struct.Struct("<iidddid??H")
+# bus_id, overcrowded
+JOURNAL_RECORD = struct.Struct("<i?")
+
+SNAPSHOT_FIELDS = (
+    "bus_id", "route_id", "lat", "lon", "speed_kmph",
+    "next_stop_idx", "eta_min", "overcrowded", "delayed", "status",
+)
+
+
+class FleetSnapshotter:
+    """
+    Periodic binary snapshots of fleet state plus an append-only journal of
+    operator edits made since the last snapshot.
+
+    The tick only copies each bus's fields into a tuple; packing and writing
+    the file happen on a background thread. The journal is rotated at capture
+    time and the old segment is deleted once the snapshot is on disk, so
+    recovery replays at most one interval of edits.
+    """
+
+    def __init__(self, directory: str, interval_s: float = 30.0):
+        self.directory = directory
+        self.interval_s = interval_s
+        self.snapshot_path = os.path.join(directory, "fleet.snap")
+        self.journal_path = os.path.join(directory, "fleet.journal")
+        self.old_journal_path = self.journal_path + ".old"
+        os.makedirs(directory, exist_ok=True)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fleet-snapshot")
+        self.pending = None
+        self.last_capture = time.monotonic()
+        self.journal_lock = threading.Lock()
+        self.journal = open(self.journal_path, "ab")
+        self.snapshots_written = 0
+        self.write_errors = 0
+
+    # ---- journal ----
+    def record_overcrowded(self, bus_id: int, overcrowded: bool):
+        with self.journal_lock:
+            try:
+                self.journal.write(JOURNAL_RECORD.pack(bus_id, overcrowded))
+                self.journal.flush()
+            except OSError as e:
+                # The edit is still applied in memory; the next snapshot captures it
+                self.write_errors += 1
+                print("🔴 Fleet journal write failed:", e)
+
+    def _rotate_journal(self):
+        with self.journal_lock:
+            self.journal.close()
+            try:
+                if os.path.exists(self.old_journal_path):
+                    # Previous snapshot never landed; keep both segments' edits
+                    with open(self.old_journal_path, "ab") as old, open(self.journal_path, "rb") as cur:
+                        old.write(cur.read())
+                    os.remove(self.journal_path)
+                else:
+                    os.replace(self.journal_path, self.old_journal_path)
+            finally:
+                self.journal = open(self.journal_path, "ab")
+
+    # ---- snapshots ----
+    def maybe_snapshot(self, buses) -> bool:
+        """Called from the tick; captures and schedules a write when one is due."""
+        if time.monotonic() - self.last_capture < self.interval_s:
+            return False
+        if self.pending is not None and not self.pending.done():
+            return False
+        self.snapshot(buses)
+        return True
+
+    def snapshot(self, buses, wait: bool = False):
+        if self.pending is not None:
+            # The previous write owns the old journal segment until it lands
+            self.pending.result()
+            self.pending = None
+        rows = [tuple(getattr(b, f) for f in SNAPSHOT_FIELDS) for b in buses]
+        self.last_capture = time.monotonic()
+        try:
+            self._rotate_journal()
+        except OSError as e:
+            # Persistence must never fail a tick; try again next interval
+            self.write_errors += 1
+            print("🔴 Fleet journal rotation failed:", e)
+            return
+        self.pending = self.writer.submit(self._write, rows, time.time())
+        if wait:
+            self.pending.result()
+
+    def _write(self, rows: List[Tuple], taken_at: float):
+        try:
+            self._write_snapshot(rows, taken_at)
+        except Exception as e:
+            # The old journal segment stays on disk, so its edits go into the next attempt
+            self.write_errors += 1
+            print("🔴 Fleet snapshot write failed:", e)
+
+    def _write_snapshot(self, rows: List[Tuple], taken_at: float):
+        parts = [HEADER.pack(MAGIC, VERSION, taken_at, len(rows))]
+        for row in rows:
+            status = row[-1].encode()
+            parts.append(RECORD.pack(*row[:-1], len(status)))
+            parts.append(status)
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(parts))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        if os.path.exists(self.old_journal_path):
+            os.remove(self.old_journal_path)
+        self.snapshots_written += 1
+
+    # ---- restore ----
+    def restore(self, seed=None) -> Optional[List[Dict]]:
+        """
+        Snapshot rows with journaled edits applied. Without a snapshot, the
+        journal is replayed onto the `seed` buses instead, so edits made
+        before the first snapshot survive a crash. None if there is nothing
+        to restore.
+        """
+        rows = self._read_snapshot()
+        source = "snapshot"
+        if rows is None:
+            rows = {b.bus_id: {f: getattr(b, f) for f in SNAPSHOT_FIELDS} for b in seed or ()}
+            source = "seed fleet"
+
+        replayed = 0
+        for path in (self.old_journal_path, self.journal_path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                journal = f.read()
+            # A torn trailing record from a crash is ignored
+            usable = len(journal) - len(journal) % JOURNAL_RECORD.size
+            for bus_id, overcrowded in JOURNAL_RECORD.iter_unpack(journal[:usable]):
+                if bus_id in rows:
+                    rows[bus_id]["overcrowded"] = overcrowded
+                    replayed += 1
+        if source != "snapshot" and not replayed:
+            return None
+        print(f"🟢 Restored {len(rows)} buses from {source}, replayed {replayed} journal edits")
+        return list(rows.values())
+
+    def _read_snapshot(self) -> Optional[Dict[int, Dict]]:
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, "rb") as f:
+            data = f.read()
+        magic, version, _, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            print("🔴 Ignoring snapshot with unknown format:", self.snapshot_path)
+            return None
+        offset = HEADER.size
+        rows = {}
+        for _ in range(count):
+            *values, status_len = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            status = data[offset:offset + status_len].decode()
+            offset += status_len
+            row = dict(zip(SNAPSHOT_FIELDS, (*values, status)))
+            rows[row["bus_id"]] = row
+        return rows
+
+    def close(self, buses=None):
+        if buses is not None:
+            self.snapshot(buses, wait=True)
+        self.writer.shutdown(wait=True)
+        with self.journal_lock:
+            self.journal.close()
@@ -0,0 +1,99 @@
+# backend/fleet_stats.py
+
+from typing import Dict, Tuple
+
+# ETA histogram: half-minute buckets up to 2 hours, last bucket is overflow
+ETA_BUCKET_MIN = 0.5
+ETA_BUCKETS = 241
+
+
+class Aggregate:
+    """Running counters for one scope (fleet, a route or a depot)."""
+
+    def __init__(self):
+        self.buses = 0
+        self.delayed = 0
+        self.overcrowded = 0
+        self.eta_sum = 0.0
+        self.delay_hist = [0] * ETA_BUCKETS
+
+    def apply(self, state: Tuple[bool, bool, float], sign: int):
+        delayed, overcrowded, eta = state
+        self.buses += sign
+        self.delayed += sign * delayed
+        self.overcrowded += sign * overcrowded
+        self.eta_sum += sign * eta
+        if delayed:
+            bucket = min(int(eta / ETA_BUCKET_MIN), ETA_BUCKETS - 1)
+            self.delay_hist[bucket] += sign
+
+    def percentile(self, p: float):
+        # Walks a fixed number of buckets, independent of fleet size
+        if not self.delayed:
+            return 0.0
+        rank = p / 100 * self.delayed
+        seen = 0
+        for i, n in enumerate(self.delay_hist):
+            seen += n
+            if n and seen >= rank:
+                return (i + 1) * ETA_BUCKET_MIN
+        return ETA_BUCKETS * ETA_BUCKET_MIN
+
+    def summary(self):
+        return {
+            "active_buses": self.buses,
+            "delayed": self.delayed,
+            "overcrowded": self.overcrowded,
+            "avg_eta_min": round(self.eta_sum / self.buses, 1) if self.buses else 0.0,
+            "delay_eta_p50": self.percentile(50),
+            "delay_eta_p90": self.percentile(90),
+            "delay_eta_p99": self.percentile(99),
+        }
+
+
+class FleetStats:
+    """
+    Fleet, per-route and per-depot aggregates kept up to date as bus flags
+    change, so readers never have to scan the fleet.
+    """
+
+    def __init__(self, route_depots: Dict[int, str]):
+        self.route_depots = route_depots
+        self.reset()
+
+    def reset(self):
+        self.fleet = Aggregate()
+        self.by_route: Dict[int, Aggregate] = {}
+        self.by_depot: Dict[str, Aggregate] = {}
+        self.tracked: Dict[int, Tuple[int, Tuple[bool, bool, float]]] = {}
+
+    def _scopes(self, route_id: int):
+        depot = self.route_depots.get(route_id, "Unassigned")
+        route_agg = self.by_route.setdefault(route_id, Aggregate())
+        depot_agg = self.by_depot.setdefault(depot, Aggregate())
+        return self.fleet, route_agg, depot_agg
+
+    def refresh(self, bus):
+        """Record the bus's current flags, applying only the delta from last time."""
+        state = (bus.delayed, bus.overcrowded, bus.eta_min)
+        prev = self.tracked.get(bus.bus_id)
+        if prev == (bus.route_id, state):
+            return
+        if prev is not None:
+            for agg in self._scopes(prev[0]):
+                agg.apply(prev[1], -1)
+        for agg in self._scopes(bus.route_id):
+            agg.apply(state, 1)
+        self.tracked[bus.bus_id] = (bus.route_id, state)
+
+    def remove(self, bus_id: int):
+        prev = self.tracked.pop(bus_id, None)
+        if prev is not None:
+            for agg in self._scopes(prev[0]):
+                agg.apply(prev[1], -1)
+
+    def routes_summary(self):
+        return {route_id: agg.summary() for route_id, agg in sorted(self.by_route.items())}
+
+    def depots_summary(self):
+        return {depot: agg.summary() for depot, agg in sorted(self.by_depot.items())}
@@ -0,0 +1,82 @@
+# backend/headways.py
+
+from typing import Dict
+
+import numpy as np
+
+
+class HeadwayAnalyzer:
+    """
+    Per-route headways from each bus's km-along-route, for the whole fleet in
+    one batched pass: a single sort by (route, km), then gaps to the bus ahead
+    with each route's last bus wrapping around to its first.
+
+    A gap is flagged as bunching below bunch_ratio x the even-spacing headway
+    (route length / buses on route) and as a large gap above gap_ratio x it.
+    """
+
+    def __init__(self, bunch_ratio: float = 0.25, gap_ratio: float = 2.0):
+        self.bunch_ratio = bunch_ratio
+        self.gap_ratio = gap_ratio
+
+    def analyze(self, bus_ids, route_ids, km, speed_kmph, route_length_km: Dict[int, float]) -> dict:
+        bus_ids = np.asarray(bus_ids)
+        route_ids = np.asarray(route_ids)
+        km = np.asarray(km, dtype=np.float64)
+        speed = np.asarray(speed_kmph, dtype=np.float64)
+        if not len(bus_ids):
+            return {"routes": {}, "bunched": 0, "large_gaps": 0}
+
+        order = np.lexsort((km, route_ids))
+        bus_ids, route_ids, km, speed = bus_ids[order], route_ids[order], km[order], speed[order]
+
+        # Group boundaries: first index of each route's run
+        starts = np.flatnonzero(np.r_[True, route_ids[1:] != route_ids[:-1]])
+        counts = np.diff(np.r_[starts, len(route_ids)])
+        group_route = route_ids[starts]
+        lengths = np.array([route_length_km.get(int(r), 0.0) for r in group_route.tolist()])
+        per_bus_count = np.repeat(counts, counts)
+        per_bus_length = np.repeat(lengths, counts)
+
+        # Bus ahead of each bus; the last of each route wraps to that route's first
+        ahead = np.arange(1, len(km) + 1)
+        ahead[starts + counts - 1] = starts
+        gap_km = km[ahead] - km
+        gap_km[starts + counts - 1] += lengths
+        gap_min = gap_km / np.maximum(speed, 1) * 60
+
+        ideal_km = per_bus_length / per_bus_count
+        valid = per_bus_count > 1
+        bunched = valid & (gap_km < self.bunch_ratio * ideal_km)
+        large = valid & (gap_km > self.gap_ratio * ideal_km)
+
+        routes = {}
+        for g, route_id in enumerate(group_route.tolist()):
+            if counts[g] < 2:
+                continue
+            s = slice(starts[g], starts[g] + counts[g])
+            gaps = gap_km[s]
+            routes[str(route_id)] = {  # string keys, same as after a JSON round trip
+                "buses": int(counts[g]),
+                "length_km": round(float(lengths[g]), 3),
+                "ideal_headway_km": round(float(lengths[g] / counts[g]), 3),
+                "min_headway_km": round(float(gaps.min()), 3),
+                "max_headway_km": round(float(gaps.max()), 3),
+                # Coefficient of variation: 0 when perfectly evenly spaced
+                "headway_cv": round(float(gaps.std() / gaps.mean()), 3) if gaps.mean() else 0.0,
+                "bunched": _pairs(bus_ids, ahead, gap_km, gap_min, np.flatnonzero(bunched[s]) + starts[g]),
+                "large_gaps": _pairs(bus_ids, ahead, gap_km, gap_min, np.flatnonzero(large[s]) + starts[g]),
+            }
+        return {"routes": routes, "bunched": int(bunched.sum()), "large_gaps": int(large.sum())}
+
+
+def _pairs(bus_ids, ahead, gap_km, gap_min, idx):
+    return [
+        {
+            "bus_id": int(bus_ids[i]),
+            "ahead_bus_id": int(bus_ids[ahead[i]]),
+            "gap_km": round(float(gap_km[i]), 3),
+            "gap_min": round(float(gap_min[i]), 1),
+        }
+        for i in idx.tolist()
+    ]
@@ -0,0 +1,53 @@
+# backend/holiday_calendar.py
+
+import datetime
+import json
+import os
+
+# Public holidays that affect bus schedules (Tamil Nadu). National holidays
+# fall on the same date every year; festivals follow the Tamil/lunar calendar,
+# so they are listed per year. Extra or corrected dates can be supplied as
+# {"YYYY-MM-DD": "Name"} in the file at HOLIDAYS_FILE.
+FIXED_HOLIDAYS = {
+    (1, 26): "Republic Day",
+    (8, 15): "Independence Day",
+    (10, 2): "Gandhi Jayanti",
+}
+
+HOLIDAYS = {
+    "2025-01-14": "Pongal",
+    "2025-10-20": "Diwali",
+    "2026-01-15": "Pongal",
+    "2026-11-08": "Diwali",
+}
+
+holidays_file = os.getenv("HOLIDAYS_FILE")
+if holidays_file and os.path.exists(holidays_file):
+    with open(holidays_file) as f:
+        HOLIDAYS.update(json.load(f))
+
+_today = {"date": None, "info": None}
+_warned_years = set()
+
+
+def holiday_on(day: datetime.date):
+    """Holiday name for a date, or None. Dated entries win over fixed ones."""
+    return HOLIDAYS.get(day.isoformat()) or FIXED_HOLIDAYS.get((day.month, day.day))
+
+
+def today_info():
+    """Weekday/holiday info for today, resolved once per calendar day."""
+    today = datetime.date.today()
+    if _today["date"] != today:
+        year = str(today.year)
+        if year not in _warned_years and not any(d.startswith(year) for d in HOLIDAYS):
+            _warned_years.add(year)
+            print(f"🔴 No festival dates for {year}; add them to HOLIDAYS_FILE (only fixed national holidays apply)")
+        _today["info"] = {
+            "date": today.isoformat(),
+            "weekday": today.strftime("%A"),
+            "weekend": today.weekday() >= 5,
+            "holiday": holiday_on(today),
+        }
+        _today["date"] = today
+    return _today["info"]
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, Request, Query
+from fastapi import FastAPI, Request, Query, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, Response, JSONResponse
@@ -6,16 +7,36 @@ from typing import List, Dict
 from pydantic import BaseModel
 import random
 import math
+import itertools
 import datetime
 import os
 import requests
 import re
+import asyncio
+import threading
+import numpy as np
+import time
+from urllib.parse import parse_qsl
 from twilio.twiml.voice_response import VoiceResponse, Gather
 from twilio.rest import Client
+from twilio.request_validator import RequestValidator
 from dotenv import load_dotenv
-from langdetect import detect
+from langdetect import detect_langs
 from fastapi import Form
 from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from .chat_cache import ChatCache
+from .fleet_stats import FleetStats
+from .holiday_calendar import today_info
+from . import wire_format
+from .fleet_snapshot import FleetSnapshotter
+from .state_backend import create_state_backend
+from .route_geometry import build_geometries, haversine_km
+from . import telemetry_ingest
+from .telemetry_ingest import TelemetryIngest, IngestError
+from .position_history import PositionHistory
+from .headways import HeadwayAnalyzer
+from .admission import RateLimiter, AdmissionControl, BlockingPool, PoolFull
 
 class CallRequest(BaseModel):
     to_number: str
@@ -145,6 +166,119 @@ buses: List[Bus] = [
     Bus(bus_id=5, route_id=3, lat=13.0107, lon=80.2208, speed_kmph=50, status="On Route", overcrowded=False),
 ]
 
+STATE_DIR = os.getenv("FLEET_SNAPSHOT_DIR", "state")
+TICK_INTERVAL_S = float(os.getenv("BUSROUTE_TICK_INTERVAL", "3"))
+
+# "local" keeps everything in this process; "shm" shares the fleet between uvicorn workers
+state_backend = create_state_backend(os.getenv("BUSROUTE_STATE_BACKEND", "local"), STATE_DIR)
+
+snapshotter = FleetSnapshotter(
+    STATE_DIR,
+    interval_s=float(os.getenv("FLEET_SNAPSHOT_INTERVAL", "30")),
+)
+restored = snapshotter.restore(seed=buses)
+if restored:
+    buses = [Bus(**row) for row in restored]
+
+bus_index: Dict[int, Bus] = {b.bus_id: b for b in buses}
+chat_cache = ChatCache()
+
+route_depots: Dict[int, str] = {
+    1: "Vadapalani",
+    2: "Koyambedu",
+    3: "Guindy",
+}
+
+fleet_stats = FleetStats(route_depots)
+for b in buses:
+    fleet_stats.refresh(b)
+
+# Buses move along precomputed route polylines; progress is km along the route
+route_geometry = build_geometries(routes)
+bus_progress: Dict[int, float] = {}
+MAX_TICK_DT_S = float(os.getenv("BUSROUTE_MAX_TICK_DT", "10"))  # cap after idle gaps
+last_tick = {"at": None}
+# Serializes simulation ticks with applying ingested GPS positions
+fleet_lock = threading.Lock()
+
+HISTORY_MAX_MB = float(os.getenv("HISTORY_MAX_MB", "128"))  # shared by all workers with shm
+HISTORY_CELL_BYTES = 13  # f32 lat, lon, eta + u8 flags per bus per frame
+
+def new_position_history(fleet_size, reset=False):
+    # Fixed memory: (recent + coarse frames) x bus columns. Columns cover the
+    # fleet plus ~10% for buses added later; unless set explicitly, both frame
+    # counts shrink together so the total stays within HISTORY_MAX_MB.
+    # Only the tick records (the leader's, with shm), at most once per tick
+    # interval however many dashboards POST /buses/update.
+    max_buses = int(os.getenv("HISTORY_MAX_BUSES", fleet_size + max(fleet_size // 10, 16)))
+    recent_frames = 1200  # 1 h at a 3 s tick
+    coarse_frames = 1440  # 1/min for 24 h
+    budget_frames = int(HISTORY_MAX_MB * 2**20 / (max_buses * HISTORY_CELL_BYTES))
+    if budget_frames < recent_frames + coarse_frames:
+        scale = budget_frames / (recent_frames + coarse_frames)
+        recent_frames = max(int(recent_frames * scale), 1)
+        coarse_frames = max(int(coarse_frames * scale), 1)
+    layout = dict(
+        max_buses=max_buses,
+        recent_frames=int(os.getenv("HISTORY_RECENT_FRAMES", recent_frames)),
+        coarse_frames=int(os.getenv("HISTORY_COARSE_FRAMES", coarse_frames)),
+    )
+    buffer, created = state_backend.history_buffer(PositionHistory.required_bytes(**layout))
+    history = PositionHistory(
+        **layout,
+        coarse_every=int(os.getenv("HISTORY_COARSE_EVERY", "20")),
+        min_interval_s=TICK_INTERVAL_S * 0.9,  # slack for timer jitter
+        buffer=buffer,
+        initialize=created or reset,
+    )
+    print(
+        f"🟢 Position history: {max_buses} buses x {history.recent.frames}+{history.coarse.frames} frames, "
+        f"{history.stats()['bytes'] / 2**20:.1f} MB"
+    )
+    return history
+
+position_history = new_position_history(len(buses))
+
+def load_fleet(new_buses: List[Bus], new_routes: Dict[int, List[Stop]] = None):
+    """Replace the whole fleet (and optionally the routes) and rebuild derived state."""
+    if new_routes is not None:
+        routes.clear()
+        routes.update(new_routes)
+        route_geometry.clear()
+        route_geometry.update(build_geometries(routes))
+    bus_progress.clear()
+    buses[:] = new_buses
+    bus_index.clear()
+    bus_index.update((b.bus_id, b) for b in buses)
+    chat_cache.clear()
+    fleet_stats.reset()
+    for b in buses:
+        fleet_stats.refresh(b)
+    global position_history
+    position_history.close()
+    position_history = new_position_history(len(buses), reset=True)
+    # Computed from the old fleet; the next tick publishes a fresh one
+    state_backend.drop_report("headways")
+
+headway_analyzer = HeadwayAnalyzer(
+    bunch_ratio=float(os.getenv("HEADWAY_BUNCH_RATIO", "0.25")),  # x even-spacing headway
+    gap_ratio=float(os.getenv("HEADWAY_GAP_RATIO", "2.0")),
+)
+HEADWAY_PUSH_INTERVAL_S = 1.0
+
+def analyze_headways():
+    """Per-tick bunching / gap analysis from each bus's km along its route."""
+    n = len(buses)
+    report = headway_analyzer.analyze(
+        np.fromiter((b.bus_id for b in buses), dtype=np.int64, count=n),
+        np.fromiter((b.route_id for b in buses), dtype=np.int64, count=n),
+        np.fromiter((bus_progress[b.bus_id] for b in buses), dtype=np.float64, count=n),
+        np.fromiter((b.speed_kmph for b in buses), dtype=np.float64, count=n),
+        {route_id: g.length_km for route_id, g in route_geometry.items()},
+    )
+    report["ts"] = time.time()
+    state_backend.put_report("headways", report)
+
 complaints: List[Complaint] = []
 sos_alerts: List[SOSAlert] = []
 
@@ -155,51 +289,229 @@ landmarks = {
     "Triplicane": "Parthasarathy Temple",
 }
 
+stop_simulation = threading.Event()
+
+def simulation_leader_loop():
+    # Every worker runs this; only the one holding the leader lock ticks
+    while not stop_simulation.is_set():
+        if state_backend.is_leader():
+            for command in state_backend.pending_commands():
+                if command.get("kind") == "positions":
+                    continue  # older workers forwarded GPS here; stale by now
+                apply_overcrowded(command["bus_id"], command["overcrowded"])
+            forwarded = state_backend.pending_positions()
+            if forwarded:
+                # Several workers' batches: coalesce across them too
+                apply_positions(telemetry.coalesce(telemetry_ingest.parse_binary(forwarded)))
+            update_buses()
+            state_backend.publish(buses)
+        stop_simulation.wait(TICK_INTERVAL_S)
+
+def sync_from_backend():
+    """Mirror the leader's latest published tick into this worker's Bus objects."""
+    _, cols = state_backend.read()
+    rows = zip(*(cols[f].tolist() for f in state_backend.columns))
+    for values in rows:
+        row = dict(zip(state_backend.columns, values))
+        row["status"] = row["status"].decode()
+        bus = bus_index.get(row["bus_id"])
+        if bus is None:
+            bus = Bus(**row)
+            buses.append(bus)
+            bus_index[bus.bus_id] = bus
+            chat_cache.invalidate(bus.bus_id)
+        else:
+            before = (bus.status, bus.eta_min, bus.overcrowded)
+            for field, value in row.items():
+                setattr(bus, field, value)
+            if (bus.status, bus.eta_min, bus.overcrowded) != before:
+                chat_cache.invalidate(bus.bus_id)
+        fleet_stats.refresh(bus)
+
+@app.middleware("http")
+async def sync_shared_state(request: Request, call_next):
+    if state_backend.shared:
+        if not state_backend.leader and state_backend.changed():
+            sync_from_backend()
+        complaints.extend(Complaint(**e) for e in state_backend.new_events("complaints"))
+        sos_alerts.extend(SOSAlert(**e) for e in state_backend.new_events("sos"))
+    return await call_next(request)
+
+@app.on_event("startup")
+def start_simulation():
+    if state_backend.shared:
+        threading.Thread(target=simulation_leader_loop, name="simulation-leader", daemon=True).start()
+
+@app.on_event("shutdown")
+def save_fleet_state():
+    stop_simulation.set()
+    snapshotter.close(buses if state_backend.leader else None)
+    if state_backend.shared:
+        position_history.close()
+        state_backend.close()
+
+# -------------------------------
+# Rate limiting & admission control
+# -------------------------------
+# path -> (requests per second, burst), per client IP (per caller for Twilio webhooks)
+RATE_LIMITS = {
+    "/make_call": (0.2, 3),
+    "/login": (1, 5),
+    "/complaints": (2, 10),
+    "/sos": (1, 5),
+    "/voice": (5, 20),
+    "/process_speech": (5, 20),
+}
+TWILIO_WEBHOOKS = {"/voice", "/process_speech"}
+# Reverse proxies (ngrok, nginx) in front of us that append to X-Forwarded-For.
+# 0 = use the socket peer. Only the entries those hops appended are trusted;
+# anything to their left came from the client.
+TRUST_PROXY = int(os.getenv("BUSROUTE_TRUST_PROXY", "0"))
+twilio_validator = RequestValidator(TWILIO_AUTH_TOKEN) if TWILIO_AUTH_TOKEN else None
+
+rate_limiter = RateLimiter(RATE_LIMITS)
+admission = AdmissionControl(
+    max_concurrent=int(os.getenv("BUSROUTE_MAX_CONCURRENT", "64")),
+    max_queue_s=float(os.getenv("BUSROUTE_MAX_QUEUE_MS", "500")) / 1000,
+)
+# Blocking Twilio REST calls run here instead of on the event loop
+twilio_pool = BlockingPool(max_workers=int(os.getenv("TWILIO_POOL_SIZE", "4")), name="twilio")
+
+def client_ip(request: Request):
+    if TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        hops = [h.strip() for h in forwarded.split(",")] if forwarded else []
+        if len(hops) >= TRUST_PROXY:
+            # The address our outermost trusted proxy saw
+            return hops[-TRUST_PROXY]
+    return request.client.host if request.client else "unknown"
+
+async def rate_key(request: Request):
+    """
+    Twilio sends every webhook from a few shared egress IPs, so signed
+    webhooks are limited per caller instead; anything else per client IP.
+    """
+    if request.url.path in TWILIO_WEBHOOKS and twilio_validator is not None:
+        signature = request.headers.get("x-twilio-signature")
+        if signature:
+            form = dict(parse_qsl((await request.body()).decode("utf-8", "replace")))
+            # Twilio signs the public URL it called, not the one behind the tunnel
+            url = f"{NGROK_URL}{request.url.path}" if NGROK_URL else str(request.url)
+            if request.url.query:
+                url += f"?{request.url.query}"
+            caller = form.get("From") or form.get("CallSid")
+            if caller and twilio_validator.validate(url, form, signature):
+                return f"caller:{caller}"
+    return client_ip(request)
+
+def overloaded(path, status_code, retry_after):
+    headers = {"Retry-After": str(max(1, math.ceil(retry_after)))}
+    if path in TWILIO_WEBHOOKS:
+        # Twilio needs TwiML back, not an error page
+        resp = VoiceResponse()
+        resp.say("All our lines are busy right now. Please call again in a moment.")
+        resp.hangup()
+        return Response(content=str(resp), media_type="application/xml", headers=headers)
+    message = "Too many requests" if status_code == 429 else "Server busy, try again"
+    return JSONResponse({"status": "error", "message": message}, status_code=status_code, headers=headers)
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    path = request.url.path
+    if request.method == "POST":
+        retry_after = rate_limiter.check(path, await rate_key(request))
+        if retry_after:
+            return overloaded(path, 429, retry_after)
+    if path.startswith("/static"):
+        return await call_next(request)
+    if not await admission.acquire():
+        return overloaded(path, 503, admission.max_queue_s)
+    try:
+        return await call_next(request)
+    finally:
+        admission.release()
+
+@app.on_event("shutdown")
+def stop_twilio_pool():
+    twilio_pool.shutdown()
+
 # -------------------------------
 # Helper functions
 # -------------------------------
-def distance(lat1, lon1, lat2, lon2):
-    R = 6371
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+distance = haversine_km
 
 # -------------------------------
 # Bus movement simulation
 # -------------------------------
-@app.post("/buses/update")
 def update_buses():
-    today = datetime.datetime.now().strftime("%A")
-    for bus in buses:
-        route = routes[bus.route_id]
-        next_idx = bus.next_stop_idx
-        next_stop = route[next_idx]
-        lat_diff = next_stop.lat - bus.lat
-        lon_diff = next_stop.lon - bus.lon
-        bus.lat += lat_diff * 0.03
-        bus.lon += lon_diff * 0.03
-        if abs(lat_diff) < 0.0002 and abs(lon_diff) < 0.0002:
-            bus.next_stop_idx = (bus.next_stop_idx + 1) % len(route)
-        dist = distance(bus.lat, bus.lon, next_stop.lat, next_stop.lon)
-        bus.eta_min = round((dist / max(bus.speed_kmph, 1)) * 60, 1)
-        bus.delayed = random.choice([False, False, True])
-        if today in ["Saturday", "Sunday"]:
-            bus.delayed = True
-            bus.eta_min += 5
-        if today in ["Diwali", "Pongal"]:
-            bus.delayed = True
-            bus.eta_min += 10
+    with fleet_lock:
+        day = today_info()
+        now = time.monotonic()
+        dt = min(now - last_tick["at"], MAX_TICK_DT_S) if last_tick["at"] is not None else 0.0
+        last_tick["at"] = now
+        for bus in buses:
+            before = (bus.status, bus.eta_min, bus.overcrowded)
+            geometry = route_geometry[bus.route_id]
+            km = bus_progress.get(bus.bus_id)
+            if km is None:
+                # First tick for this bus (startup, restore, fleet reload): snap onto the route
+                km = geometry.locate(bus.lat, bus.lon)
+            km = geometry.advance(km, bus.speed_kmph, dt)
+            bus_progress[bus.bus_id] = km
+            bus.lat, bus.lon = geometry.position(km)
+            bus.next_stop_idx, dist = geometry.next_stop(km)
+            bus.eta_min = round((dist / max(bus.speed_kmph, 1)) * 60, 1)
+            bus.delayed = random.choice([False, False, True])
+            if day["weekend"]:
+                bus.delayed = True
+                bus.eta_min += 5
+            if day["holiday"]:
+                bus.delayed = True
+                bus.eta_min += 10
+            fleet_stats.refresh(bus)
+            if (bus.status, bus.eta_min, bus.overcrowded) != before:
+                chat_cache.invalidate(bus.bus_id)
+        position_history.record(time.time(), buses)
+        analyze_headways()
+        snapshotter.maybe_snapshot(buses)
     return {"message": "Buses updated"}
 
+@app.post("/buses/update")
+def trigger_update():
+    if state_backend.shared:
+        # The elected leader ticks on its own schedule
+        return {"message": "Buses updated"}
+    return update_buses()
+
 # -------------------------------
 # Bus APIs
 # -------------------------------
+BUS_FIELDS = tuple(Bus.__annotations__)
+
 @app.get("/buses")
-def get_all_buses():
-    return {"buses": buses}
+def get_all_buses(
+    request: Request,
+    fields: str = Query(None, description="Comma-separated projection, e.g. 'bus_id,lat,lon'"),
+    fmt: str = Query(None, alias="format", description="json, msgpack or columns (overrides Accept)"),
+):
+    try:
+        selected = wire_format.parse_fields(fields, BUS_FIELDS)
+    except wire_format.FieldError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    media_type = wire_format.negotiate(request.headers.get("accept"), fmt)
+    if media_type == wire_format.COLUMNS:
+        body = wire_format.encode_columns(buses, selected, Bus.__annotations__)
+    else:
+        # Plain attribute reads instead of Pydantic model serialization
+        rows = [{f: getattr(b, f) for f in selected} for b in buses]
+        body = wire_format.encode_rows(rows, media_type)
+
+    body, encoding = wire_format.compress(body, request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
 
 @app.get("/buses/{bus_id}")
 def get_bus(bus_id: int):
@@ -208,6 +520,30 @@ def get_bus(bus_id: int):
             return bus
     return {"error": "Bus not found"}
 
+@app.get("/buses/{bus_id}/history")
+def get_bus_history(
+    bus_id: int,
+    start: float = Query(None, description="Unix seconds, default 15 minutes before end"),
+    end: float = Query(None, description="Unix seconds, default now"),
+    limit: int = Query(1000, ge=1, le=10000),
+):
+    if bus_id not in bus_index:
+        return {"error": "Bus not found"}
+    end = time.time() if end is None else end
+    start = end - 900 if start is None else start
+    return {"bus_id": bus_id, "points": position_history.trail(bus_id, start, end, limit)}
+
+@app.get("/history/snapshot")
+def get_fleet_snapshot(at: float = Query(..., description="Unix seconds")):
+    snapshot = position_history.snapshot_at(at)
+    if snapshot is None:
+        return {"error": "No history at that time"}
+    return snapshot
+
+@app.get("/history/stats")
+def history_stats():
+    return position_history.stats()
+
 @app.get("/routes/{route_id}")
 def get_route(route_id: int):
     stops = routes.get(route_id, [])
@@ -216,13 +552,108 @@ def get_route(route_id: int):
             s.name = landmarks[s.name]
     return {"stops": stops}
 
+def apply_overcrowded(bus_id: int, overcrowded: bool):
+    bus = bus_index.get(bus_id)
+    if bus is None:
+        return False
+    bus.overcrowded = overcrowded
+    snapshotter.record_overcrowded(bus_id, overcrowded)
+    chat_cache.invalidate(bus_id)
+    fleet_stats.refresh(bus)
+    return True
+
 @app.patch("/buses/{bus_id}/overcrowded")
 def update_overcrowded(bus_id: int, data: OvercrowdUpdate):
-    for bus in buses:
-        if bus.bus_id == bus_id:
-            bus.overcrowded = data.overcrowded
-            return {"message": f"Bus {bus_id} overcrowded set to {data.overcrowded}"}
-    return {"error": "Bus not found"}
+    if bus_id not in bus_index:
+        return {"error": "Bus not found"}
+    if state_backend.shared:
+        # Applied by the leader on its next tick, in arrival order
+        state_backend.send_command({"bus_id": bus_id, "overcrowded": data.overcrowded})
+    else:
+        apply_overcrowded(bus_id, data.overcrowded)
+    return {"message": f"Bus {bus_id} overcrowded set to {data.overcrowded}"}
+
+# -------------------------------
+# GPS / AVL telemetry ingest
+# -------------------------------
+telemetry = TelemetryIngest(
+    max_age_s=float(os.getenv("TELEMETRY_MAX_AGE_S", "600")),
+    max_future_s=float(os.getenv("TELEMETRY_MAX_FUTURE_S", "30")),
+)
+MAX_INGEST_BYTES = 16 * 1024 * 1024
+
+def apply_positions(batch):
+    """Write one coalesced batch of reports into the fleet; the next tick recomputes ETAs from there."""
+    with fleet_lock:
+        batch = telemetry.newer_only(batch)
+        for bus_id, lat, lon, speed in zip(
+            batch["bus_id"].tolist(), batch["lat"].tolist(), batch["lon"].tolist(), batch["speed_kmph"].tolist()
+        ):
+            bus = bus_index[bus_id]
+            bus.lat, bus.lon = lat, lon
+            if not math.isnan(speed):
+                bus.speed_kmph = speed
+            # Re-snap onto the route next tick, then dead-reckon until the next report
+            bus_progress.pop(bus_id, None)
+    return len(batch)
+
+def ingest_batch(body: bytes, content_type: str):
+    received = telemetry.received
+    rejected = sum(telemetry.rejected.values())
+    batch = telemetry_ingest.parse(body, content_type)
+    known_ids = np.fromiter(bus_index, dtype=np.int32, count=len(bus_index))
+    batch = telemetry.validate(batch, known_ids, time.time())
+    applied = queued = 0
+    if state_backend.shared and not state_backend.leader:
+        # Only the leader writes fleet state; it applies these with its next
+        # tick, and may still drop some as out of order
+        if state_backend.send_positions(telemetry_ingest.encode_binary(batch)):
+            queued = len(batch)
+        else:
+            telemetry.rejected["backlog_full"] += len(batch)
+    else:
+        applied = apply_positions(batch)
+    return {
+        "received": telemetry.received - received,
+        "accepted": applied,
+        "queued": queued,
+        "rejected": sum(telemetry.rejected.values()) - rejected,
+    }
+
+@app.post("/telemetry")
+async def ingest_telemetry(request: Request):
+    body = await request.body()
+    if len(body) > MAX_INGEST_BYTES:
+        return JSONResponse({"error": f"Batch larger than {MAX_INGEST_BYTES} bytes"}, status_code=413)
+    try:
+        return await run_in_threadpool(ingest_batch, body, request.headers.get("content-type", telemetry_ingest.NDJSON))
+    except IngestError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+@app.websocket("/ws/telemetry")
+async def telemetry_stream(websocket: WebSocket):
+    # Binary messages are AVL frames, text messages NDJSON; every batch gets an ack
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                body, content_type = message["bytes"], telemetry_ingest.AVL
+            else:
+                body, content_type = message["text"].encode(), telemetry_ingest.NDJSON
+            try:
+                ack = await run_in_threadpool(ingest_batch, body, content_type)
+            except IngestError as e:
+                ack = {"error": str(e)}
+            await websocket.send_json(ack)
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/telemetry/stats")
+def telemetry_stats():
+    return telemetry.stats()
 
 # -------------------------------
 # Complaints & SOS
@@ -230,6 +661,8 @@ def update_overcrowded(bus_id: int, data: OvercrowdUpdate):
 @app.post("/complaints")
 def add_complaint(c: Complaint):
     complaints.append(c)
+    if state_backend.shared:
+        state_backend.append_event("complaints", jsonable_encoder(c))
     return {"message": "Complaint registered", "total": len(complaints)}
 
 @app.get("/complaints")
@@ -239,6 +672,8 @@ def list_complaints():
 @app.post("/sos")
 def trigger_sos(s: SOSAlert):
     sos_alerts.append(s)
+    if state_backend.shared:
+        state_backend.append_event("sos", jsonable_encoder(s))
     return {"message": "SOS received", "total": len(sos_alerts)}
 
 @app.get("/sos")
@@ -250,46 +685,172 @@ def list_sos():
 # -------------------------------
 @app.get("/admin/overview")
 def admin_overview():
-    today = datetime.datetime.now().strftime("%A")
-    festival_delay = today in ["Diwali", "Pongal"]
+    day = today_info()
+    fleet = fleet_stats.fleet
+    headways = state_backend.get_report("headways")
     return {
-        "active_buses": len(buses),
-        "delayed": sum(1 for b in buses if b.delayed),
-        "overcrowded": sum(1 for b in buses if b.overcrowded),
+        "active_buses": fleet.buses,
+        "delayed": fleet.delayed,
+        "overcrowded": fleet.overcrowded,
         "complaints": len(complaints),
         "sos": len(sos_alerts),
-        "festival_delay": festival_delay,
+        "festival_delay": day["holiday"] is not None,
+        "holiday": day["holiday"],
+        "bunched": headways["bunched"] if headways else 0,
+        "large_gaps": headways["large_gaps"] if headways else 0,
     }
 
+@app.get("/admin/headways")
+def admin_headways(route_id: int = Query(None)):
+    report = state_backend.get_report("headways")
+    if report is None:
+        return {"error": "No headway data yet"}
+    if route_id is None:
+        return report
+    route = report["routes"].get(str(route_id))
+    if route is None:
+        return {"error": "Route not found or has fewer than two buses"}
+    return {"ts": report["ts"], "route_id": route_id, **route}
+
+@app.websocket("/ws/headways")
+async def headway_stream(websocket: WebSocket):
+    # Pushes each new per-tick headway report
+    await websocket.accept()
+    last_ts = None
+    try:
+        while True:
+            report = state_backend.get_report("headways")
+            if report is not None and report["ts"] != last_ts:
+                last_ts = report["ts"]
+                await websocket.send_json(report)
+            await asyncio.sleep(HEADWAY_PUSH_INTERVAL_S)
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/admin/admission")
+def admin_admission():
+    return {
+        "rate_limits": rate_limiter.stats(),
+        "admission": admission.stats(),
+        "twilio_pool": twilio_pool.stats(),
+    }
+
+@app.get("/admin/routes")
+def admin_routes():
+    return {
+        "fleet": fleet_stats.fleet.summary(),
+        "routes": fleet_stats.routes_summary(),
+        "depots": fleet_stats.depots_summary(),
+    }
+
+@app.get("/admin/routes/{route_id}")
+def admin_route(route_id: int):
+    agg = fleet_stats.by_route.get(route_id)
+    if agg is None:
+        return {"error": "Route not found"}
+    return {"route_id": route_id, "depot": route_depots.get(route_id), **agg.summary()}
+
 # -------------------------------
 # AI Chat
 # -------------------------------
+BUS_ID_RE = re.compile(r'\b(\d+)\b')
+
+def chat_response(bus_id):
+    if bus_id is None:
+        return "I couldn't understand the bus number in your query. Please try again."
+    bus_info = bus_index.get(bus_id)
+    if bus_info:
+        return (
+            f"Bus {bus_id} is currently {bus_info.status}. "
+            f"Estimated arrival time at next stop is {bus_info.eta_min} minutes. "
+            f"{'It is overcrowded.' if bus_info.overcrowded else 'It is not overcrowded.'}"
+        )
+    return f"Sorry, no information found for bus {bus_id}."
+
 @app.get("/ai_chat")
 def ai_chat(query: str = Query(..., description="Ask about a bus, e.g., 'Where is bus 1?'")):
-    query_lower = query.lower()
-    match = re.search(r'\b(\d+)\b', query_lower)
-    if match:
-        bus_id = int(match.group())
-        bus_info = next((b for b in buses if b.bus_id == bus_id), None)
-        if bus_info:
-            response = (
-                f"Bus {bus_id} is currently {bus_info.status}. "
-                f"Estimated arrival time at next stop is {bus_info.eta_min} minutes. "
-                f"{'It is overcrowded.' if bus_info.overcrowded else 'It is not overcrowded.'}"
-            )
-        else:
-            response = f"Sorry, no information found for bus {bus_id}."
-    else:
-        response = "I couldn't understand the bus number in your query. Please try again."
-    return JSONResponse(content={"query": query, "response": response})
+    # Cache on the intent (bus_id), not the raw text, so keystroke variants share an entry
+    match = BUS_ID_RE.search(query)
+    bus_id = int(match.group()) if match else None
+    cached = chat_cache.get(bus_id)
+    if cached is None:
+        version = chat_cache.version(bus_id)
+        cached = chat_cache.put(bus_id, chat_response(bus_id), version)
+    return Response(content=ChatCache.render(query, cached), media_type="application/json")
+
+@app.get("/ai_chat/metrics")
+def ai_chat_metrics():
+    return chat_cache.stats()
 
 # -------------------------------
 # Twilio Voice
 # -------------------------------
+TWILIO_LANGS = {"en": "en-IN", "ta": "ta-IN", "hi": "hi-IN", "te": "te-IN", "kn": "kn-IN"}
+MAX_SPEECH_HINTS = 500  # Twilio's limit for <Gather hints>
+
+# Caller number -> Twilio language, so repeat callers skip detection
+caller_languages: Dict[str, str] = {}
+MAX_CALLERS = 10000
+
+def remember_language(caller, twilio_lang):
+    caller_languages.pop(caller, None)
+    caller_languages[caller] = twilio_lang
+    if len(caller_languages) > MAX_CALLERS:
+        caller_languages.pop(next(iter(caller_languages)))
+
+# CallSid -> {"language", "bus_id", "turns", "last_seen"}, least recently used first
+call_sessions: Dict[str, dict] = {}
+MAX_CALL_SESSIONS = 5000
+CALL_SESSION_TTL_S = 900
+MAX_TURNS = 5
+
+def call_session(call_sid):
+    """Per-call state so follow-up questions reuse the language and last bus."""
+    now = time.monotonic()
+    while call_sessions:
+        oldest_sid, oldest = next(iter(call_sessions.items()))
+        if now - oldest["last_seen"] < CALL_SESSION_TTL_S:
+            break
+        call_sessions.pop(oldest_sid)
+    session = call_sessions.pop(call_sid, None) or {"language": None, "bus_id": None, "turns": 0}
+    session["last_seen"] = now
+    call_sessions[call_sid] = session
+    if len(call_sessions) > MAX_CALL_SESSIONS:
+        call_sessions.pop(next(iter(call_sessions)))
+    return session
+
+def speech_gather(language):
+    return Gather(
+        input="speech",
+        action=f"{NGROK_URL}/process_speech",
+        method="POST",
+        timeout=5,
+        language=language,
+        hints=speech_hints(),
+    )
+
+def speech_hints():
+    # Bias Twilio's recognizer towards our bus numbers and stop names
+    hints = itertools.chain(
+        (stop.name for stops in routes.values() for stop in stops),
+        landmarks.values(),
+        (f"bus {bus_id}" for bus_id in bus_index),
+    )
+    return ",".join(dict.fromkeys(itertools.islice(hints, MAX_SPEECH_HINTS)))
+
+def detect_language(text):
+    """Most likely supported language of the text, and its probability."""
+    for candidate in detect_langs(text):
+        if candidate.lang in TWILIO_LANGS:
+            return TWILIO_LANGS[candidate.lang], candidate.prob
+    return "en-IN", 0.0
+
 @app.post("/voice")
 async def handle_voice_call(request: Request):
+    form = await request.form()
+    caller = form.get("From")
     resp = VoiceResponse()
-    gather = Gather(input="speech", action=f"{NGROK_URL}/process_speech", method="POST", timeout=5)
+    gather = speech_gather(caller_languages.get(caller, "en-IN"))
 
     gather.say("Welcome to Smart Bus Tracker. Please say your bus number now.")
     resp.append(gather)
@@ -300,6 +861,9 @@ async def handle_voice_call(request: Request):
 async def process_speech(request: Request):
     form = await request.form()
     speech_result = form.get("SpeechResult", "")
+    caller = form.get("From")
+    session = call_session(form.get("CallSid") or caller)
+    session["turns"] += 1
     print("🟢 Raw speech result from Twilio:", speech_result)
 
     resp = VoiceResponse()
@@ -311,10 +875,16 @@ async def process_speech(request: Request):
 
     if speech_result:
         try:
-            lang_code = detect(speech_result)
-            print("🟢 Detected language:", lang_code)
-            lang_map = {"en": "en-IN", "ta": "ta-IN", "hi": "hi-IN"}
-            twilio_lang = lang_map.get(lang_code, "en-IN")
+            if session["language"]:
+                twilio_lang = session["language"]
+            elif caller in caller_languages:
+                twilio_lang = caller_languages[caller]
+                print("🟢 Language from caller affinity:", twilio_lang)
+            else:
+                twilio_lang, prob = detect_language(speech_result)
+                print("🟢 Detected language:", twilio_lang, prob)
+                if caller and prob >= 0.7:
+                    remember_language(caller, twilio_lang)
 
             bus_id = None
             match = re.search(r'\d+', speech_result)
@@ -325,10 +895,15 @@ async def process_speech(request: Request):
                     if w in word_to_number:
                         bus_id = word_to_number[w]
                         break
+            if bus_id is None:
+                # Follow-up like "is it crowded?" refers to the last bus asked about
+                bus_id = session["bus_id"]
             print("🟢 Extracted bus_id:", bus_id)
+            session["language"] = twilio_lang
+            session["bus_id"] = bus_id
 
             if bus_id is not None:
-                bus_info = next((b for b in buses if b.bus_id == bus_id), None)
+                bus_info = bus_index.get(bus_id)
                 if bus_info:
                     nearest = nearest_stop(bus_info)
                     message = (
@@ -351,6 +926,11 @@ async def process_speech(request: Request):
 
     print("🟢 Final response to Twilio:", message)
     resp.say(message, language=twilio_lang)
+    if speech_result and session["turns"] < MAX_TURNS:
+        gather = speech_gather(twilio_lang)
+        gather.say("You can ask about another bus, or hang up.", language=twilio_lang)
+        resp.append(gather)
+        resp.say("Goodbye!", language=twilio_lang)
     resp.hangup()
     return Response(content=str(resp), media_type="application/xml")
 
@@ -368,12 +948,15 @@ async def make_call():
         return {"status": "error", "message": "VERIFIED_NUMBER not set in .env"}
 
     try:
-        call = twilio_client.calls.create(
+        call = await twilio_pool.run(
+            twilio_client.calls.create,
             to=to_number,
             from_=TWILIO_PHONE_NUMBER,
             url=f"{NGROK_URL}/voice"
         )
         return {"status": "calling", "call_sid": call.sid}
+    except PoolFull:
+        return JSONResponse({"status": "error", "message": "Too many calls in progress"}, status_code=503)
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
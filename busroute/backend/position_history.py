@@ -0,0 +1,282 @@
+# backend/position_history.py
+
+import time
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+DELAYED = 1
+OVERCROWDED = 2
+
+
+class Allocator:
+    """
+    Carves arrays out of one buffer (a shared memory segment), back to back
+    and 8-byte aligned, or allocates private arrays when buffer is None.
+    `offset` ends up as the bytes needed, so a dry run sizes a layout.
+    """
+
+    def __init__(self, buffer=None, dry: bool = False):
+        self.buffer = buffer
+        self.dry = dry
+        self.offset = 0
+
+    def __call__(self, shape, dtype) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        if self.dry:
+            array = np.broadcast_to(np.zeros((), dtype), shape)
+        elif self.buffer is None:
+            array = np.empty(shape, dtype)
+        else:
+            array = np.ndarray(shape, dtype, buffer=self.buffer, offset=self.offset)
+        self.offset += -(-nbytes // 8) * 8
+        return array
+
+
+class FrameRing:
+    """
+    Fixed number of fleet frames, oldest overwritten first. Frame i holds one
+    row per bus column; lat is NaN where a bus had no position in that frame.
+    Frame timestamps only ever increase, so lookups are binary searches over
+    the logical (oldest-first) order.
+    """
+
+    def __init__(self, frames: int, columns: int, alloc: Allocator):
+        self.frames = frames
+        self.ts = alloc((frames,), np.float64)
+        self.lat = alloc((frames, columns), np.float32)
+        self.lon = alloc((frames, columns), np.float32)
+        self.eta = alloc((frames, columns), np.float32)
+        self.flags = alloc((frames, columns), np.uint8)
+        self.cursor = alloc((2,), np.int64)  # next physical slot to write, frames held
+
+    def reset(self):
+        self.ts[:] = 0
+        self.lat[:] = np.nan
+        self.lon[:] = 0
+        self.eta[:] = 0
+        self.flags[:] = 0
+        self.cursor[:] = 0
+
+    @property
+    def head(self) -> int:
+        return int(self.cursor[0])
+
+    @head.setter
+    def head(self, value: int):
+        self.cursor[0] = value
+
+    @property
+    def count(self) -> int:
+        return int(self.cursor[1])
+
+    @count.setter
+    def count(self, value: int):
+        self.cursor[1] = value
+
+    def append(self, ts, lat, lon, eta, flags):
+        i = self.head
+        self.ts[i] = ts
+        self.lat[i] = lat
+        self.lon[i] = lon
+        self.eta[i] = eta
+        self.flags[i] = flags
+        self.head = (i + 1) % self.frames
+        self.count = min(self.count + 1, self.frames)
+
+    def physical(self, logical: int) -> int:
+        return (self.head - self.count + logical) % self.frames
+
+    def ts_at(self, logical: int) -> float:
+        return self.ts[self.physical(logical)]
+
+    def oldest_ts(self) -> Optional[float]:
+        return float(self.ts_at(0)) if self.count else None
+
+    def at_or_before(self, t: float) -> Optional[int]:
+        i = bisect_right(range(self.count), t, key=self.ts_at) - 1
+        return i if i >= 0 else None
+
+    def between(self, start: float, end: float) -> np.ndarray:
+        """Physical slots of frames with start <= ts <= end, oldest first."""
+        lo = bisect_left(range(self.count), start, key=self.ts_at)
+        hi = bisect_right(range(self.count), end, key=self.ts_at)
+        return (self.head - self.count + np.arange(lo, hi)) % self.frames
+
+    def newest_ts(self) -> Optional[float]:
+        return float(self.ts_at(self.count - 1)) if self.count else None
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.ts, self.lat, self.lon, self.eta, self.flags))
+
+
+class PositionHistory:
+    """
+    Columnar position history with two tiers: every frame for the recent
+    window, and every `coarse_every`-th frame for a longer one. Memory is
+    fixed at construction (frames x max_buses per tier), whatever the uptime.
+
+    Frames closer than min_interval_s to the previous one are skipped, so
+    the tiers cover the same wall-clock span however often record() is
+    called. With a shared `buffer` one writer records and any process
+    reads; a sequence counter (odd while writing) lets readers retry
+    instead of returning a torn frame.
+    """
+
+    def __init__(self, max_buses: int, recent_frames: int = 600, coarse_frames: int = 1440, coarse_every: int = 20,
+                 min_interval_s: float = 0.0, buffer=None, initialize: bool = True, alloc: Allocator = None):
+        alloc = alloc or Allocator(buffer)
+        self.max_buses = max_buses
+        self.coarse_every = coarse_every
+        self.min_interval_s = min_interval_s
+        self.meta = alloc((3,), np.int64)  # sequence, frames recorded, columns assigned
+        self.bus_ids = alloc((max_buses,), np.int64)  # column -> bus_id
+        self.recent = FrameRing(recent_frames, max_buses, alloc)
+        self.coarse = FrameRing(coarse_frames, max_buses, alloc)
+        self.columns: Dict[int, int] = {}  # bus_id -> column, rebuilt from bus_ids
+        self.dropped_buses = 0
+        if initialize and not alloc.dry:
+            self.meta[:] = 0
+            self.bus_ids[:] = -1
+            self.recent.reset()
+            self.coarse.reset()
+        self._sync_columns()
+
+    @classmethod
+    def required_bytes(cls, max_buses: int, recent_frames: int, coarse_frames: int, **_) -> int:
+        alloc = Allocator(dry=True)
+        cls(max_buses, recent_frames, coarse_frames, alloc=alloc)
+        return alloc.offset
+
+    def close(self):
+        """Drop the array views so a shared buffer can be released."""
+        self.meta = self.bus_ids = self.recent = self.coarse = None
+
+    def _sync_columns(self):
+        # Another process may have assigned columns since we last looked
+        n = int(self.meta[2])
+        if len(self.columns) != n:
+            self.columns = {int(b): c for c, b in enumerate(self.bus_ids[:n].tolist())}
+
+    def _column(self, bus_id: int) -> Optional[int]:
+        col = self.columns.get(bus_id)
+        if col is None and len(self.columns) < self.max_buses:
+            col = self.columns[bus_id] = len(self.columns)
+            self.bus_ids[col] = bus_id
+            self.meta[2] = len(self.columns)
+        return col
+
+    def _read(self, fn, retries: int = 5):
+        """Run a reader until no frame was written underneath it."""
+        for _ in range(retries):
+            seq = int(self.meta[0])
+            if not seq & 1:
+                self._sync_columns()
+                result = fn()
+                if int(self.meta[0]) == seq:
+                    return result
+            time.sleep(0.001)
+        self._sync_columns()
+        return fn()
+
+    def record(self, ts: float, buses: Iterable) -> bool:
+        newest = self.recent.newest_ts()
+        if newest is not None and ts - newest < self.min_interval_s:
+            return False
+        lat = np.full(self.max_buses, np.nan, dtype=np.float32)
+        lon = np.zeros(self.max_buses, dtype=np.float32)
+        eta = np.zeros(self.max_buses, dtype=np.float32)
+        flags = np.zeros(self.max_buses, dtype=np.uint8)
+        rows = []
+        for bus in buses:
+            col = self._column(bus.bus_id)
+            if col is None:
+                self.dropped_buses += 1
+                continue
+            rows.append((col, bus.lat, bus.lon, bus.eta_min, bus.delayed * DELAYED | bus.overcrowded * OVERCROWDED))
+        if rows:
+            cols, lats, lons, etas, fl = zip(*rows)
+            cols = np.array(cols)
+            lat[cols], lon[cols], eta[cols], flags[cols] = lats, lons, etas, fl
+        recorded = int(self.meta[1])
+        self.meta[0] += 1
+        self.recent.append(ts, lat, lon, eta, flags)
+        if recorded % self.coarse_every == 0:
+            self.coarse.append(ts, lat, lon, eta, flags)
+        self.meta[1] = recorded + 1
+        self.meta[0] += 1
+        return True
+
+    def trail(self, bus_id: int, start: float, end: float, limit: int = 1000) -> List[dict]:
+        return self._read(lambda: self._trail(bus_id, start, end, limit))
+
+    def _trail(self, bus_id: int, start: float, end: float, limit: int) -> List[dict]:
+        col = self.columns.get(bus_id)
+        if col is None:
+            return []
+        segments = []
+        recent_oldest = self.recent.oldest_ts()
+        if recent_oldest is None or start < recent_oldest:
+            # Coarse frames only fill in what the recent tier has already overwritten
+            slots = self.coarse.between(start, end)
+            if recent_oldest is not None:
+                slots = slots[self.coarse.ts[slots] < recent_oldest]
+            segments.append((self.coarse, slots))
+        segments.append((self.recent, self.recent.between(start, end)))
+
+        points = []
+        for ring, slots in segments:
+            slots = slots[~np.isnan(ring.lat[slots, col])]
+            points.extend(_rows(ring, slots, col))
+        if len(points) > limit:
+            # Evenly thin long trails, always keeping the newest point
+            keep = np.linspace(len(points) - 1, 0, limit).round().astype(int)[::-1]
+            points = [points[i] for i in keep]
+        return points
+
+    def snapshot_at(self, t: float) -> Optional[dict]:
+        """The last fleet frame recorded at or before t."""
+        return self._read(lambda: self._snapshot_at(t))
+
+    def _snapshot_at(self, t: float) -> Optional[dict]:
+        recent_oldest = self.recent.oldest_ts()
+        ring = self.recent if recent_oldest is not None and t >= recent_oldest else self.coarse
+        i = ring.at_or_before(t)
+        if i is None:
+            return None
+        slot = ring.physical(i)
+        cols = np.flatnonzero(~np.isnan(ring.lat[slot]) & (self.bus_ids >= 0))
+        return {
+            "ts": float(ring.ts[slot]),
+            "buses": [{"bus_id": int(self.bus_ids[c]), **_point(ring, slot, c)} for c in cols.tolist()],
+        }
+
+    def stats(self):
+        self._sync_columns()
+        return {
+            "buses": len(self.columns),
+            "max_buses": self.max_buses,
+            "recent_frames": self.recent.count,
+            "coarse_frames": self.coarse.count,
+            "oldest_recent_ts": self.recent.oldest_ts(),
+            "oldest_coarse_ts": self.coarse.oldest_ts(),
+            "dropped_buses": self.dropped_buses,
+            "bytes": self.recent.nbytes() + self.coarse.nbytes(),
+        }
+
+
+def _point(ring: FrameRing, slot: int, col: int) -> dict:
+    flags = int(ring.flags[slot, col])
+    return {
+        "lat": round(float(ring.lat[slot, col]), 5),
+        "lon": round(float(ring.lon[slot, col]), 5),
+        "eta_min": round(float(ring.eta[slot, col]), 1),
+        "delayed": bool(flags & DELAYED),
+        "overcrowded": bool(flags & OVERCROWDED),
+    }
+
+
+def _rows(ring: FrameRing, slots: np.ndarray, col: int) -> List[dict]:
+    return [{"ts": float(ring.ts[s]), **_point(ring, s, col)} for s in slots.tolist()]
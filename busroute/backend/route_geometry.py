@@ -0,0 +1,110 @@
+# backend/route_geometry.py
+
+import json
+import math
+import os
+from bisect import bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+EARTH_RADIUS_KM = 6371
+
+# Optional road shapes as {"route_id": [[lat, lon], ...]} in ROUTE_SHAPES_FILE.
+# Routes without a shape follow straight lines between their stops.
+ROUTE_SHAPES: Dict[int, List[Tuple[float, float]]] = {}
+
+shapes_file = os.getenv("ROUTE_SHAPES_FILE")
+if shapes_file and os.path.exists(shapes_file):
+    with open(shapes_file) as f:
+        ROUTE_SHAPES.update({int(k): [tuple(p) for p in v] for k, v in json.load(f).items()})
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+class RouteGeometry:
+    """
+    A route as a closed polyline with cumulative distances. A bus position is
+    a single km-along-route scalar; lat/lon and the next stop are looked up
+    with a binary search over the precomputed arrays.
+    """
+
+    def __init__(self, stops: Sequence, shape: Optional[List[Tuple[float, float]]] = None):
+        points = list(shape) if shape else [(s.lat, s.lon) for s in stops]
+        if points[0] != points[-1]:
+            points.append(points[0])  # buses loop back to the first stop
+        self.lats = [p[0] for p in points]
+        self.lons = [p[1] for p in points]
+        self.cum_km = [0.0]
+        for i in range(1, len(points)):
+            step = haversine_km(self.lats[i - 1], self.lons[i - 1], self.lats[i], self.lons[i])
+            self.cum_km.append(self.cum_km[-1] + step)
+        self.length_km = self.cum_km[-1]
+
+        if shape:
+            self.stop_km = self._match_stops(stops)
+        else:
+            self.stop_km = self.cum_km[:len(stops)]
+
+    def _match_stops(self, stops) -> List[float]:
+        """Pin each stop to the nearest shape vertex, scanning forward so stops stay in order."""
+        stop_km = []
+        start = 0
+        for stop in stops:
+            best = min(
+                range(start, len(self.lats)),
+                key=lambda i: haversine_km(stop.lat, stop.lon, self.lats[i], self.lons[i]),
+            )
+            stop_km.append(self.cum_km[best])
+            start = best
+        return stop_km
+
+    def position(self, km: float) -> Tuple[float, float]:
+        if self.length_km == 0:
+            return self.lats[0], self.lons[0]
+        km %= self.length_km
+        i = min(bisect_right(self.cum_km, km), len(self.cum_km) - 1)
+        seg_start, seg_end = self.cum_km[i - 1], self.cum_km[i]
+        t = (km - seg_start) / (seg_end - seg_start) if seg_end > seg_start else 0.0
+        return (
+            self.lats[i - 1] + (self.lats[i] - self.lats[i - 1]) * t,
+            self.lons[i - 1] + (self.lons[i] - self.lons[i - 1]) * t,
+        )
+
+    def advance(self, km: float, speed_kmph: float, dt_s: float) -> float:
+        if self.length_km == 0:
+            return 0.0
+        return (km + speed_kmph * dt_s / 3600) % self.length_km
+
+    def next_stop(self, km: float) -> Tuple[int, float]:
+        """(index of the next stop, km left to reach it)"""
+        idx = bisect_right(self.stop_km, km) % len(self.stop_km)
+        target = self.stop_km[idx] if idx else self.length_km
+        return idx, max(target - km, 0.0)
+
+    def locate(self, lat: float, lon: float) -> float:
+        """Km along the route of the closest point to (lat, lon); used once per bus to seed progress."""
+        scale = math.cos(math.radians(lat))  # local equirectangular projection
+        best_km, best_d2 = 0.0, float("inf")
+        for i in range(1, len(self.lats)):
+            ax, ay = self.lons[i - 1] * scale, self.lats[i - 1]
+            bx, by = self.lons[i] * scale, self.lats[i]
+            px, py = lon * scale, lat
+            dx, dy = bx - ax, by - ay
+            seg2 = dx * dx + dy * dy
+            t = 0.0 if seg2 == 0 else max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / seg2))
+            cx, cy = ax + t * dx, ay + t * dy
+            d2 = (px - cx) ** 2 + (py - cy) ** 2
+            if d2 < best_d2:
+                best_d2 = d2
+                best_km = self.cum_km[i - 1] + t * (self.cum_km[i] - self.cum_km[i - 1])
+        return best_km
+
+
+def build_geometries(routes: Dict[int, Sequence]) -> Dict[int, RouteGeometry]:
+    return {rid: RouteGeometry(stops, ROUTE_SHAPES.get(rid)) for rid, stops in routes.items()}
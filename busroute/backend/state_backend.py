@@ -0,0 +1,336 @@
+# backend/state_backend.py
+
+import fcntl
+import json
+import mmap
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Fleet columns mirrored into shared memory, in Bus field names
+FLEET_COLUMNS = (
+    ("bus_id", "<i4"),
+    ("route_id", "<i4"),
+    ("lat", "<f8"),
+    ("lon", "<f8"),
+    ("speed_kmph", "<f8"),
+    ("status", "S16"),
+    ("overcrowded", "?"),
+    ("next_stop_idx", "<i4"),
+    ("eta_min", "<f8"),
+    ("delayed", "?"),
+)
+
+# Header words: sequence counter, bus count, leader pid, applied command-log offset
+HEADER_WORDS = 4
+HEADER_BYTES = 64
+
+
+class SharedLog:
+    """
+    Append-only JSON-lines file shared by all workers. Each line is written
+    with a single O_APPEND write, so concurrent appenders never interleave.
+    Every reader keeps its own offset.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        open(path, "ab").close()
+
+    def append(self, record: Dict):
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def read_new(self) -> List[Dict]:
+        if os.path.getsize(self.path) <= self.offset:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        # Only consume complete lines; a half-written tail is picked up next time
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+        return [json.loads(line) for line in data[:end].splitlines() if line]
+
+
+class DrainLog:
+    """
+    Binary spool from many writers to one reader. Writers append under a
+    shared flock; the reader takes an exclusive flock, reads everything and
+    truncates, so the file never holds more than one drain interval of
+    records. Appends are refused once max_bytes are waiting (no reader).
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 2**20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.refused = 0
+        open(path, "ab").close()
+
+    def append(self, data: bytes) -> bool:
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            if os.fstat(fd).st_size + len(data) > self.max_bytes:
+                self.refused += 1
+                return False
+            os.write(fd, data)
+            return True
+        finally:
+            os.close(fd)
+
+    def drain(self) -> bytes:
+        with open(self.path, "r+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            data = f.read()
+            if data:
+                f.truncate(0)
+        return data
+
+
+class LocalStateBackend:
+    """Single-process mode: the module globals in main.py are the state."""
+
+    shared = False
+    leader = True
+
+    def __init__(self):
+        self.reports: Dict[str, Dict] = {}
+
+    def is_leader(self) -> bool:
+        return True
+
+    def publish(self, buses):
+        pass
+
+    def changed(self) -> bool:
+        return False
+
+    def put_report(self, name: str, report: Dict):
+        self.reports[name] = report
+
+    def get_report(self, name: str):
+        return self.reports.get(name)
+
+    def drop_report(self, name: str):
+        self.reports.pop(name, None)
+
+    def history_buffer(self, size: int):
+        """(buffer, created) for position history; None means private memory."""
+        return None, True
+
+
+class SharedMemoryStateBackend:
+    """
+    Fleet state shared by `uvicorn --workers N` processes on one host.
+
+    Fleet columns live in one multiprocessing.shared_memory segment. Exactly
+    one worker (whoever holds an flock on leader.lock) runs the simulation and
+    publishes each tick under a sequence counter: odd while writing, even when
+    stable. Readers copy the columns without taking any lock and retry if the
+    counter moved underneath them.
+
+    Position history lives in a second segment that only the leader writes.
+
+    Writes from other workers (PATCH overcrowded, complaints, SOS) go through
+    SharedLog files, GPS reports through a DrainLog spool; the leader
+    applies both on its next tick. Derived
+    per-tick reports (headways) are small JSON files replaced atomically.
+    """
+
+    shared = True
+
+    def __init__(self, state_dir: str, name: str = "busroute_fleet", capacity: int = 20000):
+        os.makedirs(state_dir, exist_ok=True)
+        self.capacity = capacity
+        size = HEADER_BYTES + sum(np.dtype(t).itemsize * capacity for _, t in FLEET_COLUMNS)
+        self.state_dir = state_dir
+        self.name = name
+        self.shm, _ = self._segment(name, size)
+        self.history_shm = None
+
+        self.header = np.ndarray((HEADER_WORDS,), dtype="<u8", buffer=self.shm.buf)
+        self.columns: Dict[str, np.ndarray] = {}
+        offset = HEADER_BYTES
+        for field, dtype in FLEET_COLUMNS:
+            self.columns[field] = np.ndarray((capacity,), dtype=dtype, buffer=self.shm.buf, offset=offset)
+            offset += np.dtype(dtype).itemsize * capacity
+
+        self.lock_file = open(os.path.join(state_dir, "leader.lock"), "a")
+        self.leader = False
+        self.last_seq = 0
+        self.last_read = None  # (seq, snapshot) of the last consistent read
+        self.commands = SharedLog(os.path.join(state_dir, "commands.log"))
+        self.positions = DrainLog(os.path.join(state_dir, "positions.spool"))
+        self.events = {
+            kind: SharedLog(os.path.join(state_dir, f"{kind}.log")) for kind in ("complaints", "sos")
+        }
+        self.pid = os.getpid()
+        self.reports: Dict[str, Tuple[int, Dict]] = {}  # name -> (mtime_ns, report)
+
+    def _segment(self, name: str, size: int):
+        """Create or attach the named segment. Returns (shm, created)."""
+        # Workers starting together must agree on one segment
+        with open(os.path.join(self.state_dir, "segment.lock"), "a") as segment_lock:
+            fcntl.flock(segment_lock, fcntl.LOCK_EX)
+            created = True
+            try:
+                shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                shm = shared_memory.SharedMemory(name=name)
+                created = False
+                # Left over from a run with another layout (some platforms round up to a page)
+                if not size <= shm.size < size + mmap.PAGESIZE:
+                    print(f"🔴 Recreating shared segment {name}: {shm.size} bytes, need {size}")
+                    shm.close()
+                    shm.unlink()
+                    shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                    created = True
+            # Workers come and go; the segment must outlive any single one of them
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm, created
+
+    def history_buffer(self, size: int):
+        """
+        Position history segment, shared so every worker serves the trails
+        the leader records. Returns (buffer, created).
+        """
+        if self.history_shm is not None:
+            self.history_shm.close()
+        self.history_shm, created = self._segment(f"{self.name}_history", size)
+        return self.history_shm.buf, created
+
+    # ---- leader election ----
+    def is_leader(self) -> bool:
+        if not self.leader:
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            self.leader = True
+            self.header[2] = self.pid
+            if self.header[0] & 1:
+                # Previous leader died mid-publish; we republish on our first tick
+                self.header[0] += 1
+            # Resume the command log where the previous leader stopped
+            self.commands.offset = int(self.header[3])
+            print(f"🟢 Worker {self.pid} elected simulation leader")
+        return True
+
+    # ---- writer side (leader only) ----
+    def publish(self, buses):
+        n = len(buses)
+        if n > self.capacity:
+            raise RuntimeError(f"Fleet of {n} exceeds shared capacity {self.capacity}")
+        # Build the column values before opening the write window
+        staged = {field: [getattr(b, field) for b in buses] for field, _ in FLEET_COLUMNS}
+        staged["status"] = [s.encode()[:16] for s in staged["status"]]
+        self.header[0] += 1
+        for field, values in staged.items():
+            self.columns[field][:n] = values
+        self.header[1] = n
+        self.header[3] = self.commands.offset
+        self.header[0] += 1
+        self.last_seq = int(self.header[0])
+
+    def pending_commands(self) -> List[Dict]:
+        return self.commands.read_new()
+
+    def pending_positions(self) -> bytes:
+        return self.positions.drain()
+
+    # ---- reader side ----
+    def changed(self) -> bool:
+        return int(self.header[0]) != self.last_seq
+
+    def read(self, retries: int = 50, backoff_s: float = 0.001) -> Tuple[int, Dict[str, np.ndarray]]:
+        """
+        Consistent copy of the fleet columns without taking a lock. While the
+        leader is mid-publish, retry a few times with a short sleep, then fall
+        back to the last consistent copy rather than spin.
+        """
+        attempt = 0
+        while True:
+            seq = int(self.header[0])
+            if not seq & 1:
+                n = int(self.header[1])
+                snapshot = {field: column[:n].copy() for field, column in self.columns.items()}
+                if int(self.header[0]) == seq:
+                    self.last_seq = seq
+                    self.last_read = (seq, snapshot)
+                    return seq, snapshot
+            attempt += 1
+            if attempt >= retries and self.last_read is not None:
+                return self.last_read
+            time.sleep(backoff_s)
+
+    # ---- cross-worker writes ----
+    def send_command(self, record: Dict):
+        self.commands.append(record)
+
+    def send_positions(self, data: bytes) -> bool:
+        """Queue encoded position reports for the leader; False if its spool is full."""
+        return self.positions.append(data)
+
+    def append_event(self, kind: str, record: Dict):
+        self.events[kind].append({"pid": self.pid, **record})
+
+    def new_events(self, kind: str) -> List[Dict]:
+        # Our own appends are already in the local list
+        return [e for e in self.events[kind].read_new() if e.pop("pid") != self.pid]
+
+    def put_report(self, name: str, report: Dict):
+        path = os.path.join(self.state_dir, f"{name}.json")
+        tmp = f"{path}.{self.pid}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(report, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def get_report(self, name: str):
+        path = os.path.join(self.state_dir, f"{name}.json")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self.reports.get(name)
+        if cached is None or cached[0] != mtime:
+            with open(path) as f:
+                cached = self.reports[name] = (mtime, json.load(f))
+        return cached[1]
+
+    def drop_report(self, name: str):
+        try:
+            os.remove(os.path.join(self.state_dir, f"{name}.json"))
+        except FileNotFoundError:
+            pass
+        self.reports.pop(name, None)
+
+    def close(self):
+        if self.leader:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.leader = False
+        self.lock_file.close()
+        # Views into the segment must go before it can be unmapped
+        self.header = None
+        self.columns = {}
+        self.shm.close()
+        if self.history_shm is not None:
+            self.history_shm.close()
+
+
+def create_state_backend(kind: str, state_dir: str):
+    if kind == "shm":
+        return SharedMemoryStateBackend(
+            state_dir,
+            name=os.getenv("BUSROUTE_SHM_NAME", "busroute_fleet"),
+            capacity=int(os.getenv("BUSROUTE_SHM_CAPACITY", "20000")),
+        )
+    return LocalStateBackend()
@@ -0,0 +1,127 @@
+# backend/telemetry_ingest.py
+
+import json
+from collections import Counter
+from typing import Dict
+
+import numpy as np
+
+# One GPS/AVL position report. The binary frame is just these records packed
+# back to back (32 bytes each, little endian), no header.
+REPORT_DTYPE = np.dtype([
+    ("bus_id", "<i4"),
+    ("ts", "<f8"),        # unix seconds
+    ("lat", "<f8"),
+    ("lon", "<f8"),
+    ("speed_kmph", "<f4"),  # NaN when the unit doesn't report speed
+])
+
+NDJSON = "application/x-ndjson"
+AVL = "application/vnd.busroute.avl"
+
+
+class IngestError(ValueError):
+    pass
+
+
+def parse_ndjson(body: bytes) -> np.ndarray:
+    rows = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            r = json.loads(line)
+            rows.append((r["bus_id"], r["ts"], r["lat"], r["lon"], r.get("speed_kmph", np.nan)))
+        except (ValueError, KeyError, TypeError) as e:
+            raise IngestError(f"bad report on line {len(rows) + 1}: {e}")
+    try:
+        return np.array(rows, dtype=REPORT_DTYPE)
+    except (ValueError, TypeError, OverflowError) as e:
+        # Wrong field types, or a bus_id outside int32
+        raise IngestError(f"bad report: {e}")
+
+
+def parse_binary(body: bytes) -> np.ndarray:
+    if len(body) % REPORT_DTYPE.itemsize:
+        raise IngestError(f"frame length {len(body)} is not a multiple of {REPORT_DTYPE.itemsize}")
+    return np.frombuffer(body, dtype=REPORT_DTYPE)
+
+
+def parse(body: bytes, content_type: str) -> np.ndarray:
+    if content_type.split(";")[0].strip() == AVL:
+        return parse_binary(body)
+    return parse_ndjson(body)
+
+
+def encode_binary(reports: np.ndarray) -> bytes:
+    return np.ascontiguousarray(reports, dtype=REPORT_DTYPE).tobytes()
+
+
+class TelemetryIngest:
+    """
+    Batch validation for position reports, all numpy so a batch of thousands
+    costs a handful of array passes:
+
+    - drop malformed rows, unknown buses and timestamps outside
+      [now - max_age_s, now + max_future_s]
+    - coalesce: keep only the newest report per bus in the batch
+    - drop reports not newer than the last one applied for that bus
+    """
+
+    def __init__(self, max_age_s: float = 600, max_future_s: float = 30):
+        self.max_age_s = max_age_s
+        self.max_future_s = max_future_s
+        self.last_ts: Dict[int, float] = {}
+        self.received = 0
+        self.accepted = 0
+        self.rejected = Counter()
+
+    def validate(self, batch: np.ndarray, known_ids: np.ndarray, now: float) -> np.ndarray:
+        self.received += len(batch)
+        if not len(batch):
+            return batch
+        finite = np.isfinite(batch["ts"]) & np.isfinite(batch["lat"]) & np.isfinite(batch["lon"])
+        valid = (
+            finite
+            & (np.abs(batch["lat"]) <= 90)
+            & (np.abs(batch["lon"]) <= 180)
+            & ~(batch["speed_kmph"] < 0)  # NaN (no speed) is fine
+        )
+        known = np.isin(batch["bus_id"], known_ids)
+        future = batch["ts"] > now + self.max_future_s
+        stale = batch["ts"] < now - self.max_age_s
+        self.rejected["invalid"] += int((~valid).sum())
+        self.rejected["unknown_bus"] += int((valid & ~known).sum())
+        self.rejected["future"] += int((valid & known & future).sum())
+        self.rejected["stale"] += int((valid & known & stale).sum())
+        return self.coalesce(batch[valid & known & ~future & ~stale])
+
+    def coalesce(self, batch: np.ndarray) -> np.ndarray:
+        """Keep only the newest report per bus."""
+        # Sort by (bus, ts) and keep the last row of each bus run
+        batch = batch[np.lexsort((batch["ts"], batch["bus_id"]))]
+        newest = np.ones(len(batch), dtype=bool)
+        newest[:-1] = batch["bus_id"][1:] != batch["bus_id"][:-1]
+        self.rejected["duplicate"] += int(len(batch) - newest.sum())
+        return batch[newest]
+
+    def newer_only(self, batch: np.ndarray) -> np.ndarray:
+        """Drop reports older than what was already applied, then record the new high-water marks."""
+        if not len(batch):
+            return batch
+        ids = batch["bus_id"].tolist()
+        previous = np.fromiter((self.last_ts.get(i, -np.inf) for i in ids), dtype=np.float64, count=len(ids))
+        in_order = batch["ts"] > previous
+        self.rejected["out_of_order"] += int((~in_order).sum())
+        batch = batch[in_order]
+        self.last_ts.update(zip(batch["bus_id"].tolist(), batch["ts"].tolist()))
+        self.accepted += len(batch)
+        return batch
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "accepted": self.accepted,
+            "rejected": dict(self.rejected),
+            "tracked_buses": len(self.last_ts),
+        }
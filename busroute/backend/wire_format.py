@@ -0,0 +1,102 @@
+# backend/wire_format.py
+
+import gzip
+import json
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+COLUMNS = "application/vnd.busroute.columns"
+
+# Below this size compression costs more CPU than it saves on the wire
+COMPRESS_MIN_BYTES = 1400
+
+# Column dtypes for the columnar layout, keyed by field annotation
+COLUMN_TYPECODES = {int: "i", float: "f", bool: "B"}
+
+
+class FieldError(ValueError):
+    pass
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> List[str]:
+    if not fields:
+        return list(allowed)
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in allowed]
+    if unknown:
+        raise FieldError(f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+
+def negotiate(accept: Optional[str], fmt: Optional[str] = None) -> str:
+    """Pick the response encoding from ?format= or the Accept header."""
+    wanted = (fmt or accept or "").lower()
+    if "columns" in wanted:
+        return COLUMNS
+    if "msgpack" in wanted and msgpack is not None:
+        return MSGPACK
+    return JSON
+
+
+def encode_rows(rows: List[Dict], media_type: str) -> bytes:
+    if media_type == MSGPACK:
+        return msgpack.packb({"buses": rows}, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps({"buses": rows})
+    return json.dumps({"buses": rows}, separators=(",", ":")).encode()
+
+
+def encode_columns(items, fields: List[str], annotations: Dict[str, type]) -> bytes:
+    """
+    Columnar layout: a 4-byte little-endian header length, a JSON header
+    ({"count", "fields", "dtypes", "strings"}), then one packed little-endian
+    array per numeric field (int32, float32 or uint8) in header order.
+    String fields are carried as lists inside the header.
+    """
+    header = {"count": len(items), "fields": [], "dtypes": [], "strings": {}}
+    blobs = []
+    for field in fields:
+        typecode = COLUMN_TYPECODES.get(annotations.get(field))
+        values = [getattr(item, field) for item in items]
+        if typecode is None:
+            header["strings"][field] = values
+            continue
+        column = array(typecode, values)
+        if sys.byteorder == "big":
+            column.byteswap()
+        header["fields"].append(field)
+        header["dtypes"].append({"i": "int32", "f": "float32", "B": "uint8"}[typecode])
+        blobs.append(column.tobytes())
+    head = json.dumps(header, separators=(",", ":")).encode()
+    return struct.pack("<I", len(head)) + head + b"".join(blobs)
+
+
+def compress(body: bytes, accept_encoding: Optional[str]):
+    """Returns (body, content_encoding or None)."""
+    if len(body) < COMPRESS_MIN_BYTES or not accept_encoding:
+        return body, None
+    accepted = {token.split(";")[0].strip() for token in accept_encoding.lower().split(",")}
+    if "br" in accepted and brotli is not None:
+        return brotli.compress(body, quality=4), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
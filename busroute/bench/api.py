@@ -0,0 +1,215 @@
+# bench/api.py
+#
+# In-process timings of the busroute hot paths plus a concurrent load test
+# that mimics N dashboards running the App.js polling loop.
+#
+# Run from busroute/:
+#   python -m bench.api --buses 10000 --routes 200 --dashboards 50 --duration 20
+#   python -m bench.api --url http://127.0.0.1:8000 --dashboards 200
+#   python -m bench.api --compare bench_results/api_20250101_120000.json
+
+import os
+import tempfile
+
+# Keep benchmark snapshots out of the real state directory
+os.environ.setdefault("FLEET_SNAPSHOT_DIR", tempfile.mkdtemp(prefix="busroute-bench-"))
+
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import random
+import statistics
+import time
+from collections import defaultdict
+
+import httpx
+
+from backend import main
+from bench.synthetic import make_fleet, make_routes
+
+
+def summarize(samples):
+    """Latency percentiles in milliseconds for a list of durations in seconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(int(p / 100 * len(ordered)), len(ordered) - 1)] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+# -------------------------------
+# In-process
+# -------------------------------
+def bench_inprocess(args):
+    rng = random.Random(args.seed)
+    routes = make_routes(args.routes, seed=args.seed)
+    main.load_fleet(make_fleet(args.buses, routes, seed=args.seed), routes)
+
+    cases = {
+        "update_buses": (args.ticks, lambda: main.update_buses()),
+        "get_bus": (args.iterations, lambda: main.get_bus(rng.randint(1, args.buses))),
+        "get_route": (args.iterations, lambda: main.get_route(rng.randint(1, args.routes))),
+        "admin_overview": (args.iterations, lambda: main.admin_overview()),
+        "ai_chat": (args.iterations, lambda: main.ai_chat(query=f"Where is bus {rng.randint(1, args.buses)}?")),
+    }
+    results = {}
+    for name, (iterations, fn) in cases.items():
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+        results[name] = summarize(samples)
+        print(f"  {name:16} p50={results[name]['p50_ms']:.3f}ms p99={results[name]['p99_ms']:.3f}ms")
+    return results
+
+
+# -------------------------------
+# Dashboard load generator
+# -------------------------------
+async def dashboard(client, rng, args, stop_at, latencies, counters):
+    """One browser tab: the poll() loop from App.js with a selected bus."""
+    selected = rng.randint(1, args.buses)
+    # Spread the first polls out like tabs opened at different times
+    await asyncio.sleep(rng.random() * args.interval)
+    while time.perf_counter() < stop_at:
+        cycle_start = time.perf_counter()
+        route_id = None
+        for name, method, path in (
+            ("POST /buses/update", "POST", "/buses/update"),
+            ("GET /buses", "GET", "/buses"),
+            ("GET /buses/{id}", "GET", f"/buses/{selected}"),
+            ("GET /routes/{id}", "GET", None),
+            ("GET /admin/overview", "GET", "/admin/overview"),
+        ):
+            if path is None:
+                if route_id is None:
+                    continue
+                path = f"/routes/{route_id}"
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path)
+                response.raise_for_status()
+            except httpx.HTTPError:
+                counters["errors"] += 1
+                continue
+            latencies[name].append(time.perf_counter() - start)
+            counters["requests"] += 1
+            if name == "GET /buses/{id}":
+                route_id = response.json().get("route_id")
+        counters["cycles"] += 1
+        await asyncio.sleep(max(0.0, args.interval - (time.perf_counter() - cycle_start)))
+
+
+async def run_load(args):
+    limits = httpx.Limits(max_connections=args.dashboards, max_keepalive_connections=args.dashboards)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=30)
+
+    latencies = defaultdict(list)
+    counters = {"requests": 0, "errors": 0, "cycles": 0}
+    rng = random.Random(args.seed)
+    async with client:
+        start = time.perf_counter()
+        stop_at = start + args.duration
+        await asyncio.gather(*(
+            dashboard(client, random.Random(rng.random()), args, stop_at, latencies, counters)
+            for _ in range(args.dashboards)
+        ))
+        elapsed = time.perf_counter() - start
+
+    per_endpoint = {name: summarize(samples) for name, samples in latencies.items()}
+    for name, stats in per_endpoint.items():
+        print(f"  {name:22} n={stats['count']:6d} p50={stats['p50_ms']:.2f}ms "
+              f"p95={stats['p95_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms")
+    return {
+        "per_endpoint": per_endpoint,
+        "all": summarize([s for samples in latencies.values() for s in samples]),
+        "requests": counters["requests"],
+        "errors": counters["errors"],
+        "poll_cycles": counters["cycles"],
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(counters["requests"] / elapsed, 1),
+    }
+
+
+# -------------------------------
+# Reporting
+# -------------------------------
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nChange vs {baseline_path} (p50 / p99, negative is faster):")
+    rows = [("inprocess", name) for name in current.get("inprocess", {})]
+    rows += [("load", name) for name in current.get("load", {}).get("per_endpoint", {})]
+    for section, name in rows:
+        cur = current[section][name] if section == "inprocess" else current[section]["per_endpoint"][name]
+        old_section = baseline.get(section, {})
+        old = old_section.get(name) if section == "inprocess" else old_section.get("per_endpoint", {}).get(name)
+        if not old or not old.get("count"):
+            continue
+        deltas = []
+        for key in ("p50_ms", "p99_ms"):
+            deltas.append(f"{(cur[key] - old[key]) / old[key] * 100 if old[key] else 0.0:+7.1f}%")
+        print(f"  {section:9} {name:22} {' / '.join(deltas)}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="busroute API and simulation benchmarks")
+    parser.add_argument("--buses", type=int, default=5000)
+    parser.add_argument("--routes", type=int, default=100)
+    parser.add_argument("--ticks", type=int, default=50, help="update_buses calls to time")
+    parser.add_argument("--iterations", type=int, default=2000, help="calls per read path")
+    parser.add_argument("--dashboards", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=3.0, help="poll interval per dashboard (App.js uses 3 s)")
+    parser.add_argument("--duration", type=float, default=15.0, help="load test length in seconds, 0 to skip")
+    parser.add_argument("--url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="results file (default bench_results/api_<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        }
+    }
+    if not args.url:
+        print(f"In-process ({args.buses} buses, {args.routes} routes):")
+        results["inprocess"] = bench_inprocess(args)
+    if args.duration > 0:
+        print(f"Load: {args.dashboards} dashboards polling every {args.interval}s for {args.duration}s")
+        results["load"] = asyncio.run(run_load(args))
+        print(f"  throughput {results['load']['throughput_rps']} req/s, errors {results['load']['errors']}")
+
+    out = args.out or os.path.join(
+        "bench_results", f"api_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {out}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main_cli()
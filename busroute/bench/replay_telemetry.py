@@ -0,0 +1,188 @@
+# bench/replay_telemetry.py
+#
+# Record a synthetic GPS trace, then push it at N x real time into the
+# telemetry ingest path and report the sustained ingest rate.
+#
+# Run from busroute/:
+#   python -m bench.replay_telemetry record trace.ndjson --buses 5000 --routes 200 --minutes 10 --hz 1
+#   python -m bench.replay_telemetry replay trace.ndjson --speedup 20 --buses 5000 --routes 200
+#   python -m bench.replay_telemetry replay trace.ndjson --speedup 20 --url http://127.0.0.1:8000 --binary
+#   python -m bench.replay_telemetry replay trace.ndjson --speedup 20 --url http://127.0.0.1:8000 --ws
+#
+# A live server only accepts reports for buses it knows, so record against its
+# fleet (--routes 0 uses the built-in routes, bus ids are 1..--buses).
+
+import os
+import tempfile
+
+os.environ.setdefault("FLEET_SNAPSHOT_DIR", tempfile.mkdtemp(prefix="busroute-bench-"))
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+import numpy as np
+
+from backend import main
+from backend.route_geometry import build_geometries
+from backend.telemetry_ingest import AVL, NDJSON, REPORT_DTYPE, encode_binary
+from bench.api import summarize
+from bench.synthetic import make_fleet, make_routes
+
+
+# -------------------------------
+# Trace recording
+# -------------------------------
+def fleet_for(args):
+    routes = make_routes(args.routes, seed=args.seed) if args.routes else dict(main.routes)
+    return routes, make_fleet(args.buses, routes, seed=args.seed)
+
+
+def record(args):
+    """Drive every bus along its route geometry and write one report per bus per 1/hz seconds."""
+    routes, fleet = fleet_for(args)
+    geometry = build_geometries(routes)
+    rng = random.Random(args.seed)
+    progress = {b.bus_id: geometry[b.route_id].locate(b.lat, b.lon) for b in fleet}
+    step = 1.0 / args.hz
+    count = 0
+    with open(args.trace, "w") as f:
+        for tick in range(int(args.minutes * 60 * args.hz)):
+            t = tick * step
+            for bus in fleet:
+                g = geometry[bus.route_id]
+                speed = max(0.0, bus.speed_kmph + rng.gauss(0, 3))
+                progress[bus.bus_id] = g.advance(progress[bus.bus_id], speed, step)
+                lat, lon = g.position(progress[bus.bus_id])
+                # Reporting jitter, so reports within a window arrive out of order
+                jitter = rng.uniform(0, step / 2)
+                f.write(json.dumps({
+                    "bus_id": bus.bus_id, "t": round(t + jitter, 3),
+                    "lat": round(lat, 6), "lon": round(lon, 6), "speed_kmph": round(speed, 1),
+                }) + "\n")
+                count += 1
+    print(f"Wrote {count} reports for {len(fleet)} buses ({args.minutes} min at {args.hz} Hz) to {args.trace}")
+
+
+# -------------------------------
+# Replay
+# -------------------------------
+def load_trace(path):
+    with open(path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    rows.sort(key=lambda r: r["t"])
+    t = np.array([r["t"] for r in rows])
+    reports = np.array(
+        [(r["bus_id"], 0.0, r["lat"], r["lon"], r["speed_kmph"]) for r in rows], dtype=REPORT_DTYPE
+    )
+    return t, reports
+
+
+def batches(t, reports, window_s):
+    """Split the trace into send windows of window_s trace-seconds."""
+    edges = np.searchsorted(t, np.arange(t[0], t[-1] + window_s, window_s))
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi > lo:
+            yield t[lo], t[lo:hi], reports[lo:hi]
+
+
+def encode(batch, binary):
+    if binary:
+        return encode_binary(batch), AVL
+    lines = (
+        json.dumps({"bus_id": b, "ts": ts, "lat": lat, "lon": lon, "speed_kmph": s})
+        for b, ts, lat, lon, s in batch.tolist()
+    )
+    return "\n".join(lines).encode(), NDJSON
+
+
+async def replay(args):
+    t, reports = load_trace(args.trace)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+    else:
+        routes, fleet = fleet_for(args)
+        main.load_fleet(fleet, routes)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=30)
+
+    ws = None
+    if args.ws:
+        import websockets  # only needed for the streaming variant
+
+        ws = await websockets.connect(args.url.replace("http", "ws", 1) + "/ws/telemetry", max_size=None)
+
+    latencies, lag = [], []
+    totals = {"sent": 0, "accepted": 0, "queued": 0, "rejected": 0}
+    wall_start = time.time()
+    perf_start = time.perf_counter()
+    trace_start = t[0]
+    async with client:
+        for window_t, ts, batch in batches(t, reports, args.window):
+            due = (window_t - trace_start) / args.speedup
+            delay = due - (time.perf_counter() - perf_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lag.append(max(0.0, -delay))
+            batch = batch.copy()
+            batch["ts"] = wall_start + (ts - trace_start) / args.speedup
+            body, content_type = encode(batch, args.binary or args.ws)
+
+            start = time.perf_counter()
+            if ws is not None:
+                await ws.send(body)
+                ack = json.loads(await ws.recv())
+            else:
+                response = await client.post("/telemetry", content=body, headers={"content-type": content_type})
+                response.raise_for_status()
+                ack = response.json()
+            latencies.append(time.perf_counter() - start)
+            totals["sent"] += len(batch)
+            totals["accepted"] += ack.get("accepted", 0)
+            totals["queued"] += ack.get("queued", 0)
+            totals["rejected"] += ack.get("rejected", 0)
+    if ws is not None:
+        await ws.close()
+
+    elapsed = time.perf_counter() - perf_start
+    print(f"Replayed {totals['sent']} reports in {elapsed:.1f}s at {args.speedup}x "
+          f"({(t[-1] - trace_start) / args.speedup:.1f}s scheduled)")
+    print(f"  ingest rate {totals['sent'] / elapsed:,.0f} reports/s, "
+          f"accepted {totals['accepted']}, queued for the leader {totals['queued']}, rejected {totals['rejected']}")
+    stats = summarize(latencies)
+    print(f"  batch ack  p50={stats['p50_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms over {stats['count']} batches")
+    print(f"  max lag behind schedule {max(lag) * 1000:.1f}ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Record and replay GPS telemetry traces")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("record", "replay"):
+        p = sub.add_parser(name)
+        p.add_argument("trace")
+        p.add_argument("--buses", type=int, default=1000)
+        p.add_argument("--routes", type=int, default=50, help="synthetic routes, 0 for the built-in ones")
+        p.add_argument("--seed", type=int, default=42)
+        if name == "record":
+            p.add_argument("--minutes", type=float, default=5)
+            p.add_argument("--hz", type=float, default=1, help="reports per bus per second")
+        else:
+            p.add_argument("--speedup", type=float, default=10, help="replay at N x real time")
+            p.add_argument("--window", type=float, default=1.0, help="trace seconds per batch")
+            p.add_argument("--url", help="running server (default: in-process app)")
+            p.add_argument("--binary", action="store_true", help="send AVL frames instead of NDJSON")
+            p.add_argument("--ws", action="store_true", help="stream over /ws/telemetry (needs --url)")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args)
+    else:
+        if args.ws and not args.url:
+            parser.error("--ws needs --url")
+        asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    main_cli()
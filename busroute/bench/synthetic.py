@@ -0,0 +1,45 @@
+# bench/synthetic.py
+#
+# Synthetic fleets and route sets around Chennai for the benchmarks.
+
+import random
+
+from backend.main import Bus, Stop
+
+
+def make_routes(n_routes, stops_per_route=8, seed=0):
+    rng = random.Random(seed)
+    routes = {}
+    for route_id in range(1, n_routes + 1):
+        lat, lon = 12.95 + rng.random() * 0.2, 80.10 + rng.random() * 0.2
+        stops = []
+        for i in range(stops_per_route):
+            lat += rng.uniform(-0.01, 0.01)
+            lon += rng.uniform(-0.01, 0.01)
+            stops.append(Stop(name=f"R{route_id} Stop {i}", lat=lat, lon=lon, scheduled_time=i * 5))
+        routes[route_id] = stops
+    return routes
+
+
+def make_fleet(n_buses, routes=None, seed=0):
+    rng = random.Random(seed)
+    route_ids = list(routes) if routes else [1, 2, 3]
+    fleet = []
+    for bus_id in range(1, n_buses + 1):
+        route_id = rng.choice(route_ids)
+        if routes:
+            start = rng.choice(routes[route_id])
+            lat, lon = start.lat, start.lon
+        else:
+            lat, lon = 13.0 + rng.random() * 0.1, 80.15 + rng.random() * 0.15
+        fleet.append(Bus(
+            bus_id=bus_id,
+            route_id=route_id,
+            lat=lat,
+            lon=lon,
+            speed_kmph=rng.uniform(20, 50),
+            status="On Route",
+            overcrowded=rng.random() < 0.3,
+            eta_min=round(rng.uniform(0, 15), 1),
+        ))
+    return fleet
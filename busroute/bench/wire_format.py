@@ -0,0 +1,58 @@
+# bench/wire_format.py
+#
+# Encode time and payload size of GET /buses encodings for a synthetic fleet.
+# Run from busroute/:  python -m bench.wire_format --buses 10000
+
+import argparse
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from backend.main import Bus, BUS_FIELDS
+from backend import wire_format
+from bench.synthetic import make_fleet
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - start)
+    return body, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buses", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fleet = make_fleet(args.buses)
+    projection = ["bus_id", "lat", "lon"]
+
+    def rows(fields):
+        return [{f: getattr(b, f) for f in fields} for b in fleet]
+
+    cases = {
+        # What FastAPI does for `return {"buses": buses}`
+        "baseline (pydantic + json)": lambda: json.dumps(jsonable_encoder({"buses": fleet})).encode(),
+        "json fast path": lambda: wire_format.encode_rows(rows(BUS_FIELDS), wire_format.JSON),
+        "json ?fields=bus_id,lat,lon": lambda: wire_format.encode_rows(rows(projection), wire_format.JSON),
+        "columns": lambda: wire_format.encode_columns(fleet, list(BUS_FIELDS), Bus.__annotations__),
+        "columns ?fields=bus_id,lat,lon": lambda: wire_format.encode_columns(fleet, projection, Bus.__annotations__),
+    }
+    if wire_format.msgpack is not None:
+        cases["msgpack"] = lambda: wire_format.encode_rows(rows(BUS_FIELDS), wire_format.MSGPACK)
+
+    print(f"{'encoding':34} {'ms':>8} {'bytes':>10} {'gzip':>10} {'br':>10}")
+    for name, fn in cases.items():
+        body, seconds = timed(fn, args.repeat)
+        gz, _ = wire_format.compress(body, "gzip")
+        br = wire_format.compress(body, "br")[0] if wire_format.brotli is not None else b""
+        print(f"{name:34} {seconds * 1000:8.2f} {len(body):10d} {len(gz):10d} {len(br) or '-':>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,288 @@
-import sounddevice as sd
-import wavio
-import requests
+"""
+Desktop client for the voice bus assistant.
+
+Records a question, streams it to the AI server while you are still
+speaking, asks the bus server, and plays the spoken answer as it arrives.
+
+    python integration.py                         # microphone in, speakers out
+    python integration.py --duration 8 --save     # also keep response.wav
+    python integration.py --headless clip1.wav clips/ --realtime
+                                                  # per-stage latency report
+
+Servers: AI_SERVER runs multilingual-voice-ai (/transcribe, /speak),
+BUS_SERVER runs busroute (/ai_chat). Microphone and speaker use
+sounddevice (PortAudio: macOS, Linux, Windows); headless mode needs
+only httpx, numpy and soundfile.
+"""
+
+import argparse
+import asyncio
 import os
+import statistics
+import struct
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+import soundfile as sf
 
 # --- CONFIG ---
-AI_SERVER = "http://127.0.0.1:8000"
-BUS_SERVER = "http://127.0.0.1:8001"
-AUDIO_FILE = "temp_audio.wav"
+AI_SERVER = os.getenv("AI_SERVER", "http://127.0.0.1:8000")
+BUS_SERVER = os.getenv("BUS_SERVER", "http://127.0.0.1:8001")
 OUTPUT_FILE = "response.wav"
+SAMPLE_RATE = 16000   # what Whisper wants; also keeps the upload small
+CHUNK_MS = 100        # upload granularity while recording
+
+STAGES = ("transcribe", "businfo", "tts_first_audio", "tts_total", "end_to_end")
+
+
+# --- AUDIO SOURCES ---
+async def microphone_chunks(duration, fs=SAMPLE_RATE):
+    """16-bit mono PCM blocks from the default microphone, yielded as they are captured"""
+    import sounddevice as sd
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def callback(indata, frames, time_info, status):
+        loop.call_soon_threadsafe(queue.put_nowait, bytes(indata))
 
-# --- RECORD VOICE ---
-def record_audio(duration=5, fs=44100):
     print(f"Recording for {duration} seconds... Speak now!")
-    recording = sd.rec(int(duration * fs), samplerate=fs, channels=1)
-    sd.wait()
-    wavio.write(AUDIO_FILE, recording, fs, sampwidth=2)
-    print(f"Saved your recording as {AUDIO_FILE}")
-
-# --- SEND AUDIO TO AI ---
-def get_text_from_audio(audio_file_path):
-    with open(audio_file_path, "rb") as f:
-        files = {"file": f}
-        response = requests.post(f"{AI_SERVER}/process_audio", files=files)
-    response.raise_for_status()
-    data = response.json()
-    return data.get("text", "")
+    with sd.RawInputStream(samplerate=fs, channels=1, dtype="int16",
+                           blocksize=fs * CHUNK_MS // 1000, callback=callback):
+        end = loop.time() + duration
+        while (remaining := end - loop.time()) > 0:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+    while not queue.empty():
+        yield queue.get_nowait()
+    print("Recording finished")
+
+
+def file_source(path, realtime=False):
+    """(sample_rate, chunk generator) for a WAV file; realtime paces chunks like a live microphone"""
+    audio, fs = sf.read(str(path), dtype="int16", always_2d=True)
+    pcm = (audio[:, 0] if audio.shape[1] == 1 else audio.mean(axis=1)).astype("<i2").tobytes()
+    step = fs * CHUNK_MS // 1000 * 2
+
+    async def chunks():
+        for offset in range(0, len(pcm), step):
+            if realtime:
+                await asyncio.sleep(CHUNK_MS / 1000)
+            yield pcm[offset:offset + step]
+
+    return fs, chunks()
+
+
+async def marked(chunks, marks, name):
+    """Pass chunks through, noting when the source runs dry"""
+    async for chunk in chunks:
+        yield chunk
+    marks[name] = time.perf_counter()
+
+
+# --- AUDIO SINKS ---
+class SpeakerSink:
+    """Plays 16-bit mono PCM through the default output device as it is written"""
+
+    def __init__(self):
+        import sounddevice as sd
+        self.sd = sd
+        self.stream = None
+
+    def open(self, rate):
+        self.stream = self.sd.RawOutputStream(samplerate=rate, channels=1, dtype="int16")
+        self.stream.start()
+
+    async def write(self, pcm):
+        # write() blocks until the device buffer has room
+        await asyncio.to_thread(self.stream.write, pcm)
+
+    async def close(self):
+        if self.stream is not None:
+            await asyncio.to_thread(self.stream.stop)
+            self.stream.close()
+
+
+class FileSink:
+    def __init__(self, path=OUTPUT_FILE):
+        self.path = path
+        self.file = None
+
+    def open(self, rate):
+        self.file = sf.SoundFile(self.path, "w", samplerate=rate, channels=1, subtype="PCM_16")
+
+    async def write(self, pcm):
+        self.file.write(np.frombuffer(pcm, dtype="<i2"))
+
+    async def close(self):
+        if self.file is not None:
+            self.file.close()
+            print(f"Audio response saved to {self.path}")
 
-# --- GET BUS INFO ---
-def get_bus_info(user_query):
-    payload = {"query": user_query}
-    response = requests.post(f"{BUS_SERVER}/businfo", json=payload)
+
+class NullSink:
+    """Headless runs: discard the audio, only the timings matter"""
+
+    def open(self, rate):
+        pass
+
+    async def write(self, pcm):
+        pass
+
+    async def close(self):
+        pass
+
+
+class TeeSink:
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def open(self, rate):
+        for sink in self.sinks:
+            sink.open(rate)
+
+    async def write(self, pcm):
+        for sink in self.sinks:
+            await sink.write(pcm)
+
+    async def close(self):
+        for sink in self.sinks:
+            await sink.close()
+
+
+def parse_wav_header(buf):
+    """(sample_rate, data_offset) once the header is complete, else None"""
+    if len(buf) < 12:
+        return None
+    if buf[:4] != b"RIFF" or buf[8:12] != b"WAVE":
+        raise ValueError("response is not a WAV stream")
+    offset, rate = 12, None
+    while offset + 8 <= len(buf):
+        chunk_id, size = buf[offset:offset + 4], struct.unpack("<I", buf[offset + 4:offset + 8])[0]
+        if chunk_id == b"fmt " and offset + 16 <= len(buf):
+            rate = struct.unpack("<I", buf[offset + 12:offset + 16])[0]
+        if chunk_id == b"data":
+            return rate, offset + 8
+        offset += 8 + size
+    return None
+
+
+# --- PIPELINE ---
+async def ask(client, rate, chunks, sink):
+    """One question end to end. Returns (transcript, reply, stage timings in ms)."""
+    marks = {"start": time.perf_counter()}
+
+    # Upload while recording: httpx sends the generator as a chunked body
+    response = await client.post(
+        f"{AI_SERVER}/transcribe", params={"rate": rate}, content=marked(chunks, marks, "recorded")
+    )
     response.raise_for_status()
-    return response.json()
+    heard = response.json()
+    marks["transcribed"] = time.perf_counter()
 
-# --- CONVERT TEXT TO SPEECH ---
-def text_to_speech(text, output_file=OUTPUT_FILE):
-    payload = {"text": text}
-    response = requests.post(f"{AI_SERVER}/speak", json=payload)
+    response = await client.get(f"{BUS_SERVER}/ai_chat", params={"query": heard["text"]})
     response.raise_for_status()
-    with open(output_file, "wb") as f:
-        f.write(response.content)
-    print(f"Audio response saved to {output_file}")
-    # Play the audio
-    os.system(f"afplay {output_file}")
+    reply = response.json().get("response", "Sorry, I could not find the bus info.")
+    marks["businfo"] = time.perf_counter()
+
+    async with client.stream("POST", f"{AI_SERVER}/speak",
+                             json={"text": reply, "language": heard["language"]}) as response:
+        if response.status_code == 503:
+            print("TTS unavailable, answer not spoken")
+        else:
+            response.raise_for_status()
+            header, pending = b"", b""
+            async for data in response.aiter_bytes():
+                if header is not None:
+                    header += data
+                    parsed = parse_wav_header(header)
+                    if parsed is None:
+                        continue
+                    sink.open(parsed[0])
+                    data, header = header[parsed[1]:], None
+                # Keep writes sample-aligned across network chunk boundaries
+                data, pending = pending + data, b""
+                if len(data) % 2:
+                    data, pending = data[:-1], data[-1:]
+                if data:
+                    marks.setdefault("first_audio", time.perf_counter())
+                    await sink.write(data)
+    await sink.close()
+    marks["done"] = time.perf_counter()
+
+    def ms(a, b):
+        return round((marks[b] - marks[a]) * 1000, 1) if a in marks and b in marks else None
+
+    timings = {
+        "transcribe": ms("recorded", "transcribed"),
+        "businfo": ms("transcribed", "businfo"),
+        "tts_first_audio": ms("businfo", "first_audio"),
+        "tts_total": ms("businfo", "done"),
+        # What the user feels: end of their question to the first sound of the answer
+        "end_to_end": ms("recorded", "first_audio"),
+    }
+    return heard["text"], reply, timings
+
+
+def collect_clips(paths):
+    clips = []
+    for p in map(Path, paths):
+        clips.extend(sorted(p.glob("*.wav")) if p.is_dir() else [p])
+    return clips
+
+
+async def run_headless(client, args):
+    results = []
+    for clip in collect_clips(args.headless):
+        rate, chunks = file_source(clip, realtime=args.realtime)
+        sink = FileSink() if args.save else NullSink()
+        text, reply, timings = await ask(client, rate, chunks, sink)
+        results.append(timings)
+        print(f"{clip.name}: '{text}' -> '{reply[:60]}'")
+        print("   " + "  ".join(f"{k}={v}ms" for k, v in timings.items() if v is not None))
+
+    if len(results) > 1:
+        print(f"\nSummary over {len(results)} clips (ms):")
+        for stage in STAGES:
+            values = [r[stage] for r in results if r[stage] is not None]
+            if values:
+                print(f"  {stage:16} p50={statistics.median(values):8.1f}  max={max(values):8.1f}")
+
+
+async def run_interactive(client, args):
+    try:
+        sink = SpeakerSink()
+    except (ImportError, OSError) as e:
+        print(f"No audio output ({e}); saving to {OUTPUT_FILE} instead")
+        sink = FileSink()
+    else:
+        if args.save:
+            sink = TeeSink(sink, FileSink())
+    text, reply, timings = await ask(client, SAMPLE_RATE, microphone_chunks(args.duration), sink)
+    print(f"You said: {text}")
+    print(f"Bus info: {reply}")
+    print(f"Answer started {timings['end_to_end']} ms after you stopped speaking")
+
 
 # --- MAIN WORKFLOW ---
-if __name__ == "__main__":
-    record_audio(duration=5)  # change duration if you need longer
-    text_query = get_text_from_audio(AUDIO_FILE)
-    print(f"You said: {text_query}")
+async def main(args):
+    # One pooled client for both servers: connections stay open between stages and runs
+    limits = httpx.Limits(max_connections=8, max_keepalive_connections=8)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(60, connect=5), limits=limits) as client:
+        if args.headless:
+            await run_headless(client, args)
+        else:
+            await run_interactive(client, args)
 
-    bus_response = get_bus_info(text_query)
-    print(f"Bus info: {bus_response}")
 
-    speech_text = bus_response.get("message", "Sorry, I could not find the bus info.")
-    text_to_speech(speech_text)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Voice bus assistant client")
+    parser.add_argument("--duration", type=float, default=5, help="seconds to record")
+    parser.add_argument("--save", action="store_true", help=f"also write the answer to {OUTPUT_FILE}")
+    parser.add_argument("--headless", nargs="+", metavar="WAV", help="WAV files or directories instead of the microphone")
+    parser.add_argument("--realtime", action="store_true", help="headless: send audio at speaking pace")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,264 @@
+"""
+Offline voice pipeline benchmark.
+
+Feeds local WAV clips through the same stages as /process_audio
+(download -> transcribe_audio -> extract_intent_and_entities ->
+get_bus_info_response -> generate_speech_stream) at a configurable
+concurrency. The TTS stage is timed until the streamed audio has been
+fully produced, and a fallback (apology text, error reply, pre-rendered
+clip) counts as a failed call rather than a fast one.
+Twilio is replaced by a local HTTP server that serves the clips as
+recordings, so no phone call or Twilio account is needed.
+
+Run from multilingual-voice-ai/:
+    python -m bench.voice_pipeline --calls 20 --concurrency 4
+    python -m bench.voice_pipeline --audio ../temp_audio.wav clips/ --out results.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+import wave
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# The local recording server ignores credentials, but the downloader sends them
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbench")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "bench")
+
+from main import download_twilio_recording
+from utils.whisper_handler import transcribe_audio
+from utils.nlp_handler import extract_intent_and_entities
+from utils.business_logic import get_bus_info_response, get_error_response
+from utils.tts_handler import pending_streams, start_speech_stream, stream_audio
+from utils.artifact_store import recording_store
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_CLIPS = sorted(REPO_ROOT.glob("*.wav"))
+STAGES = ("download", "transcribe", "nlp", "business", "tts", "total")
+
+
+class SilentClip(Exception):
+    """Whisper had nothing to transcribe; not a pipeline failure"""
+
+
+def collect_clips(paths):
+    """Expand files and directories into a list of WAV paths"""
+    clips = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            clips.extend(sorted(p.glob("*.wav")))
+        elif p.exists():
+            clips.append(p)
+        else:
+            logger.warning(f"⚠️ Skipping missing clip: {p}")
+    return clips
+
+
+def clip_duration(path) -> float:
+    try:
+        with wave.open(str(path)) as w:
+            return w.getnframes() / w.getframerate()
+    except wave.Error:
+        import soundfile as sf
+        return sf.info(str(path)).duration
+
+
+def start_recording_server(clips):
+    """
+    Local stand-in for Twilio's recording URLs.
+    GET /Recordings/<sid>.wav serves clip number <sid> (round robin).
+    """
+    blobs = [Path(c).read_bytes() for c in clips]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            name = self.path.rsplit("/", 1)[-1].removesuffix(".wav")
+            try:
+                body = blobs[int(name.removeprefix("RE")) % len(blobs)]
+            except ValueError:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/wav")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run_call(call_no, base_url, timings):
+    """One simulated call through every pipeline stage"""
+    marks = {}
+    start = time.perf_counter()
+
+    t = time.perf_counter()
+    audio_path = await download_twilio_recording(f"{base_url}/Recordings/RE{call_no}", f"RE{call_no}")
+    marks["download"] = time.perf_counter() - t
+
+    try:
+        t = time.perf_counter()
+        transcript, language = await transcribe_audio(audio_path)
+        marks["transcribe"] = time.perf_counter() - t
+        if language is None:
+            if not transcript:
+                raise SilentClip()
+            # transcribe_audio swallows errors and returns an apology
+            raise RuntimeError(f"transcription failed: {transcript!r}")
+
+        t = time.perf_counter()
+        intent, entities = await extract_intent_and_entities(transcript, language)
+        marks["nlp"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        response_text, language = await get_bus_info_response(intent, entities, language)
+        marks["business"] = time.perf_counter() - t
+        if response_text == get_error_response(language):
+            raise RuntimeError("business logic failed")
+
+        t = time.perf_counter()
+        stream_id = start_speech_stream(response_text, language)
+        if stream_id is None:
+            raise RuntimeError("TTS unavailable")
+        producer = pending_streams[stream_id]["task"]
+        async for _ in stream_audio(stream_id):
+            pass
+        marks["tts"] = time.perf_counter() - t
+        if not await producer:
+            raise RuntimeError("TTS failed, fallback clip streamed")
+    finally:
+        recording_store.remove(os.path.basename(audio_path))
+
+    marks["total"] = time.perf_counter() - start
+    for stage, seconds in marks.items():
+        timings[stage].append(seconds)
+    return marks
+
+
+def summarize(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(int(p / 100 * len(ordered)), len(ordered) - 1)] * 1000, 1)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 1),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+async def run_benchmark(clips, calls, concurrency):
+    server = start_recording_server(clips)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    durations = [clip_duration(c) for c in clips]
+    timings = defaultdict(list)
+    audio_seconds = 0.0
+    failures = 0
+    silent = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def guarded(call_no):
+        nonlocal audio_seconds, failures, silent
+        async with semaphore:
+            try:
+                await run_call(call_no, base_url, timings)
+                audio_seconds += durations[call_no % len(clips)]
+            except SilentClip:
+                silent += 1
+                logger.warning(f"⚠️ Call {call_no}: clip is silent")
+            except Exception as e:
+                failures += 1
+                logger.error(f"❌ Call {call_no} failed: {e}")
+
+    # Warm-up call so model loading and first-run allocations are not measured
+    await guarded(0)
+    timings.clear()
+    audio_seconds = 0.0
+    failures = silent = 0
+
+    start = time.perf_counter()
+    await asyncio.gather(*(guarded(i) for i in range(1, calls + 1)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    transcribe_total = sum(timings["transcribe"])
+    return {
+        "clips": [str(c) for c in clips],
+        "calls": calls,
+        "failures": failures,
+        # Silent clips stop after Whisper, so they are not in the throughput
+        "silent_clips": silent,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "calls_per_minute": round((calls - failures - silent) / elapsed * 60, 1),
+        "audio_seconds": round(audio_seconds, 2),
+        # Whisper seconds per second of audio; below 1.0 is faster than real time
+        "transcribe_rtf": round(transcribe_total / audio_seconds, 3) if audio_seconds else None,
+        "pipeline_rtf": round(sum(timings["total"]) / audio_seconds, 3) if audio_seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {stage: summarize(timings[stage]) for stage in STAGES},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline voice pipeline benchmark")
+    parser.add_argument("--audio", nargs="+", default=[str(p) for p in DEFAULT_CLIPS],
+                        help="WAV files or directories of clips (default: WAVs in the repo root)")
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--out", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    clips = collect_clips(args.audio)
+    if not clips:
+        parser.error("no WAV clips found")
+
+    report = asyncio.run(run_benchmark(clips, args.calls, args.concurrency))
+
+    print(f"\n📊 {report['calls']} calls, concurrency {report['concurrency']}, {len(clips)} clip(s)")
+    print(f"{'stage':12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage, s in report["stages"].items():
+        if s["count"]:
+            print(f"{stage:12} {s['p50_ms']:9.1f} {s['p95_ms']:9.1f} {s['p99_ms']:9.1f} {s['max_ms']:9.1f}")
+    print(f"Throughput: {report['calls_per_minute']} calls/min, failures: {report['failures']}, "
+          f"silent clips: {report['silent_clips']}")
+    print(f"Real-time factor: transcribe {report['transcribe_rtf']}, pipeline {report['pipeline_rtf']}")
+    print(f"Peak RSS: {report['peak_rss_mb']} MB")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to {args.out}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -1,21 +1,30 @@
 from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import Response, FileResponse
+from fastapi.responses import Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
 import uvicorn
 import os
 import httpx
 import asyncio
+import io
 import logging
 from pathlib import Path
 import uuid
 from datetime import datetime
+from xml.sax.saxutils import escape
+import numpy as np
+import soundfile as sf
 
 # Import our utility modules
 from utils.whisper_handler import transcribe_audio
 from utils.nlp_handler import extract_intent_and_entities
-from utils.tts_handler import generate_speech
+from utils.tts_handler import generate_speech_stream, start_speech_stream, stream_audio, pending_streams
 from utils.business_logic import get_bus_info_response
+from utils.artifact_store import recording_store
+from utils import degraded_mode
+from utils.session_store import sessions
+from utils.tts_handler import speaker_mapping
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -32,6 +41,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Questions answered per call before we say goodbye
+MAX_TURNS = int(os.getenv("MAX_TURNS", "5"))
+
 # Create necessary directories
 os.makedirs("twilio_audio", exist_ok=True)
 os.makedirs("static/audio", exist_ok=True)
@@ -39,6 +51,11 @@ os.makedirs("static/audio", exist_ok=True)
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+@app.on_event("startup")
+async def start_artifact_eviction():
+    """Background TTL sweeps for downloaded recordings"""
+    asyncio.create_task(recording_store.run_eviction())
+
 @app.get("/")
 async def home():
     """Home endpoint with API info"""
@@ -47,6 +64,9 @@ async def home():
         "endpoints": {
             "voice": "/voice - Twilio webhook for incoming calls",
             "process_audio": "/process_audio - Process recorded audio",
+            "transcribe": "/transcribe - Transcribe streamed PCM audio",
+            "speak": "/speak - Stream a spoken reply",
+            "call_status": "/call_status - Twilio status callback, ends the call session",
             "test": "/test - Test endpoint"
         },
         "status": "🟢 Online"
@@ -62,6 +82,9 @@ async def voice_webhook(request: Request):
     # Get caller info
     form_data = await request.form()
     caller_number = form_data.get("From", "Unknown")
+    call_sid = form_data.get("CallSid")
+    if call_sid:
+        sessions.get_or_create(call_sid, caller_number)
     
     logger.info(f"📞 Call from: {caller_number}")
     
@@ -89,6 +112,7 @@ async def voice_webhook(request: Request):
 
 @app.post("/process_audio")
 async def process_audio_webhook(
+    request: Request,
     RecordingUrl: str = Form(...),
     RecordingSid: str = Form(...),
     CallSid: str = Form(...),
@@ -97,6 +121,7 @@ async def process_audio_webhook(
     """
     Process the recorded audio from Twilio
     """
+    audio_path = None
     try:
         logger.info(f"🎤 Processing audio: {RecordingSid}")
         
@@ -104,41 +129,75 @@ async def process_audio_webhook(
         audio_path = await download_twilio_recording(RecordingUrl, RecordingSid)
         logger.info(f"📁 Audio downloaded: {audio_path}")
         
-        # Step 2: Speech-to-Text (Whisper)
-        transcript, detected_language = await transcribe_audio(audio_path)
+        session = sessions.get_or_create(CallSid, From)
+        session.turns += 1
+        
+        # Step 2: Speech-to-Text (Whisper) - follow-up turns reuse the call's language
+        transcript, detected_language = await transcribe_audio(
+            audio_path, caller=From, language=session.language
+        )
+        if detected_language:
+            session.language = detected_language
+        else:
+            # Nothing recognised: answer in the call's language so far
+            detected_language = session.language or "hindi"
         logger.info(f"📝 Transcript: {transcript} (Language: {detected_language})")
         
         # Step 3: NLP Intent Recognition
         intent, entities = await extract_intent_and_entities(transcript, detected_language)
+        entities = session.merge_entities(entities)
         logger.info(f"🧠 Intent: {intent}, Entities: {entities}")
         
-        # Step 4: Business Logic
-        response_text, language = await get_bus_info_response(intent, entities, detected_language)
+        # Step 4: Business Logic (answers are cached for the rest of the call)
+        lookup_key = (intent, entities.get("location"), entities.get("bus_number"), detected_language)
+        if lookup_key in session.answers:
+            response_text, language = session.answers[lookup_key], detected_language
+        else:
+            response_text, language = await get_bus_info_response(intent, entities, detected_language)
+            session.answers[lookup_key] = response_text
         logger.info(f"📋 Response: {response_text}")
         
-        # Step 5: Text-to-Speech
-        audio_file_url = await generate_speech(response_text, language, str(request.base_url))
+        # Step 5: Text-to-Speech (streamed sentence by sentence, same speaker all call)
+        if session.tts_config is None:
+            session.tts_config = speaker_mapping.get(language, speaker_mapping["default"])
+        audio_file_url = await generate_speech_stream(
+            response_text, language, str(request.base_url), config=session.tts_config
+        )
         logger.info(f"🔊 Audio generated: {audio_file_url}")
         
         # Step 6: Return TwiML with the audio response
+        # (Twilio's own <Say> while our TTS circuit is open)
+        if audio_file_url:
+            reply = f"<Play>{audio_file_url}</Play>"
+        else:
+            reply = f"<Say {degraded_mode.say_attrs(language)}>{escape(response_text)}</Say>"
+        
+        # Keep listening for follow-up questions until MAX_TURNS
+        if session.turns < MAX_TURNS:
+            follow_up = f'''<Say voice="Polly.Aditi" language="hi-IN">
+                Aur kuch puchna chahte hain? Beep ke baad boliye, aur hash key dabayiye.
+            </Say>
+            <Record 
+                maxLength="30" 
+                action="{str(request.base_url).rstrip('/')}/process_audio" 
+                method="POST" 
+                playBeep="true" 
+                timeout="3"
+                finishOnKey="#"
+            />'''
+        else:
+            follow_up = ""
         twiml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
         <Response>
-            <Play>{audio_file_url}</Play>
+            {reply}
             <Pause length="1"/>
-            <Say voice="Polly.Aditi" language="hi-IN">
-                Aur kuch puchna chahte hain? Hash key dabayiye.
-            </Say>
-            <Pause length="3"/>
+            {follow_up}
             <Say voice="Polly.Aditi" language="hi-IN">
                 Aapka din shubh ho! Phir milenge!
             </Say>
             <Hangup/>
         </Response>'''
         
-        # Cleanup the downloaded audio file
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-            
         return Response(content=twiml_response, media_type="application/xml")
         
     except Exception as e:
@@ -155,6 +214,63 @@ async def process_audio_webhook(
         </Response>'''
         
         return Response(content=error_twiml, media_type="application/xml")
+    
+    finally:
+        # Cleanup the downloaded audio file on every path
+        if audio_path:
+            recording_store.remove(os.path.basename(audio_path))
+
+@app.post("/call_status")
+async def call_status_webhook(CallSid: str = Form(...), CallStatus: str = Form("")):
+    """
+    Twilio status callback - drop the call's session once it is over
+    """
+    if CallStatus in ("completed", "busy", "failed", "no-answer", "canceled"):
+        sessions.end(CallSid)
+    return Response(status_code=204)
+
+@app.get("/tts/stream/{stream_id}.wav")
+async def tts_stream(stream_id: str):
+    """
+    Chunked WAV for a reply started in /process_audio; Twilio can begin
+    playback as soon as the first sentence is synthesized
+    """
+    if stream_id not in pending_streams:
+        raise HTTPException(status_code=404, detail="Audio stream not found")
+    return StreamingResponse(stream_audio(stream_id), media_type="audio/wav")
+
+@app.post("/transcribe")
+async def transcribe_upload(request: Request, rate: int = 16000, language: str = None):
+    """
+    Raw 16-bit mono PCM, typically streamed in chunks while the user is
+    still speaking (integration.py), so only Whisper is left once it ends
+    """
+    chunks = [chunk async for chunk in request.stream()]
+    pcm = b"".join(chunks)
+    audio = np.frombuffer(pcm[: len(pcm) - len(pcm) % 2], dtype="<i2")
+    buffer = io.BytesIO()
+    sf.write(buffer, audio, rate, format="WAV", subtype="PCM_16")
+    name = recording_store.put(buffer.getvalue(), name=f"upload_{uuid.uuid4().hex}.wav")
+    try:
+        transcript, detected_language = await transcribe_audio(recording_store.path(name), language=language)
+    finally:
+        recording_store.remove(name)
+    return {"text": transcript, "language": detected_language or language or "hindi"}
+
+class SpeakRequest(BaseModel):
+    text: str
+    language: str = "english"
+
+@app.post("/speak")
+async def speak(payload: SpeakRequest):
+    """
+    Chunked WAV of the reply, sentence by sentence, for clients that play
+    audio as it arrives
+    """
+    stream_id = start_speech_stream(payload.text, payload.language)
+    if stream_id is None:
+        raise HTTPException(status_code=503, detail="TTS unavailable")
+    return StreamingResponse(stream_audio(stream_id), media_type="audio/wav")
 
 async def download_twilio_recording(recording_url: str, recording_sid: str) -> str:
     """
@@ -164,7 +280,6 @@ async def download_twilio_recording(recording_url: str, recording_sid: str) -> s
         # Create unique filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"recording_{timestamp}_{recording_sid}.wav"
-        file_path = os.path.join("twilio_audio", filename)
         
         # Download the recording with authentication
         auth = (os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
@@ -176,10 +291,9 @@ async def download_twilio_recording(recording_url: str, recording_sid: str) -> s
             response.raise_for_status()
             
             # Save the file
-            with open(file_path, "wb") as f:
-                f.write(response.content)
+            recording_store.put(response.content, name=filename)
         
-        return file_path
+        return recording_store.path(filename)
         
     except Exception as e:
         logger.error(f"Error downloading recording: {e}")
@@ -194,7 +308,12 @@ async def test_endpoint():
         "directories_exist": {
             "twilio_audio": os.path.exists("twilio_audio"),
             "static/audio": os.path.exists("static/audio")
-        }
+        },
+        "sessions": sessions.stats(),
+        "artifact_stores": {
+            "twilio_audio": recording_store.stats()
+        },
+        "degraded_mode": degraded_mode.status()
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactStore:
+    """
+    Bounded on-disk store for generated audio and downloaded recordings
+
+    - Content-addressed names (sha256) so identical audio is stored once
+    - In-memory index of live files, kept in least-recently-used order
+    - Evicts by TTL and by total size / file count, oldest first
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_s: float, max_files: int = 100000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.max_files = max_files
+        self.index = OrderedDict()  # name -> (size, last_access)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.evicted = 0
+        self.dedup_hits = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Adopt whatever is already on disk (e.g. from a previous run)"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for mtime, name, size in sorted(entries):
+            self.index[name] = (size, mtime)
+            self.total_bytes += size
+        logger.info(f"🗂️ {self.directory}: indexed {len(self.index)} files ({self.total_bytes // 1024} KB)")
+        self.evict()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def put(self, data: bytes, suffix: str = ".wav", name: Optional[str] = None) -> str:
+        """
+        Store bytes and return the artifact name
+        Without an explicit name the content hash is used, which dedups repeats
+        """
+        if name is None:
+            name = hashlib.sha256(data).hexdigest()[:32] + suffix
+        with self.lock:
+            if name in self.index:
+                self.dedup_hits += 1
+                self._touch(name)
+                return name
+
+        tmp_path = self.path(name) + f".{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(name))
+
+        with self.lock:
+            if name in self.index:
+                self.total_bytes -= self.index[name][0]
+            self.index[name] = (len(data), time.time())
+            self.index.move_to_end(name)
+            self.total_bytes += len(data)
+        self.evict()
+        return name
+
+    def get(self, name: str) -> Optional[str]:
+        """Path of a live artifact, or None"""
+        with self.lock:
+            if name not in self.index:
+                return None
+            self._touch(name)
+        return self.path(name)
+
+    def remove(self, name: str):
+        with self.lock:
+            entry = self.index.pop(name, None)
+            if entry:
+                self.total_bytes -= entry[0]
+        if entry:
+            self._unlink(name)
+
+    def _touch(self, name: str):
+        size, _ = self.index[name]
+        self.index[name] = (size, time.time())
+        self.index.move_to_end(name)
+
+    def _unlink(self, name: str):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def evict(self) -> int:
+        """Drop expired files, then the least recently used until under the caps"""
+        now = time.time()
+        victims = []
+        with self.lock:
+            while self.index:
+                name, (size, last_access) = next(iter(self.index.items()))
+                over_cap = self.total_bytes > self.max_bytes or len(self.index) > self.max_files
+                if not over_cap and now - last_access < self.ttl_s:
+                    break
+                self.index.popitem(last=False)
+                self.total_bytes -= size
+                victims.append(name)
+        for name in victims:
+            self._unlink(name)
+        self.evicted += len(victims)
+        if victims:
+            logger.info(f"🧹 {self.directory}: evicted {len(victims)} files")
+        return len(victims)
+
+    async def run_eviction(self, interval_s: float = 60):
+        """Background task: periodic TTL sweep"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                await loop.run_in_executor(None, self.evict)
+            except Exception as e:
+                logger.error(f"❌ Eviction error in {self.directory}: {e}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "files": len(self.index),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+                "evicted": self.evicted,
+                "dedup_hits": self.dedup_hits,
+            }
+
+
+# Downloaded caller recordings
+recording_store = ArtifactStore(
+    "twilio_audio",
+    max_bytes=int(os.getenv("RECORDING_STORE_MAX_MB", "256")) * 1024 * 1024,
+    ttl_s=float(os.getenv("RECORDING_STORE_TTL_S", "600")),
+)
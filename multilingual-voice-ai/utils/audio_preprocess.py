@@ -0,0 +1,101 @@
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
+from math import gcd
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+TARGET_SR = 16000          # Whisper's native sample rate
+FRAME_MS = 30              # VAD frame size
+MAX_SECONDS = 30.0         # Matches maxLength="30" on the /voice <Record>
+PAD_MS = 200               # Speech kept around each detected segment
+LONG_PAUSE_MS = 800        # Silence this long splits the recording
+JOIN_GAP_MS = 200          # Silence re-inserted between kept segments
+MIN_SPEECH_MS = 150        # Anything shorter is treated as a click/noise
+ABS_THRESHOLD_DB = -45.0   # Frames quieter than this are never speech
+NOISE_MARGIN_DB = 10.0     # Speech must be this far above the noise floor
+
+
+def load_audio(audio_path: str) -> np.ndarray:
+    """
+    Decode any soundfile-readable file to 16 kHz mono float32
+    """
+    audio, sr = sf.read(audio_path, dtype="float32", always_2d=True)
+    audio = audio.mean(axis=1)
+    if sr != TARGET_SR:
+        g = gcd(sr, TARGET_SR)
+        audio = resample_poly(audio, TARGET_SR // g, sr // g).astype(np.float32)
+    return audio
+
+
+def detect_speech_frames(audio: np.ndarray, sr: int = TARGET_SR) -> np.ndarray:
+    """
+    Energy VAD over fixed frames, fully vectorized
+    Returns: boolean array, one entry per frame
+    """
+    frame = sr * FRAME_MS // 1000
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool)
+    frames = audio[: n_frames * frame].reshape(n_frames, frame)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+
+    # Adaptive threshold: quietest 10% of frames approximate the line noise
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = max(ABS_THRESHOLD_DB, noise_floor + NOISE_MARGIN_DB)
+    speech = energy_db > threshold
+
+    # Hangover: keep a few frames either side so word edges aren't clipped
+    pad = max(1, PAD_MS // FRAME_MS)
+    return np.convolve(speech.astype(np.int8), np.ones(2 * pad + 1, dtype=np.int8), mode="same") > 0
+
+
+def speech_segments(speech: np.ndarray) -> List[tuple]:
+    """
+    Group speech frames into (start_frame, end_frame) segments,
+    merging segments separated by less than LONG_PAUSE_MS
+    """
+    if not speech.any():
+        return []
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    gap_frames = LONG_PAUSE_MS // FRAME_MS
+    keep_break = (starts[1:] - ends[:-1]) >= gap_frames
+    seg_starts = np.concatenate(([starts[0]], starts[1:][keep_break]))
+    seg_ends = np.concatenate((ends[:-1][keep_break], [ends[-1]]))
+
+    min_frames = max(1, MIN_SPEECH_MS // FRAME_MS)
+    return [(int(s), int(e)) for s, e in zip(seg_starts, seg_ends) if e - s >= min_frames]
+
+
+def preprocess_audio(audio_path: str) -> Optional[np.ndarray]:
+    """
+    Decode, trim silence and split on long pauses before Whisper
+    Returns: 16 kHz mono float32 speech-only audio, or None if the recording is silent
+    """
+    audio = load_audio(audio_path)
+    original_seconds = len(audio) / TARGET_SR
+
+    segments = speech_segments(detect_speech_frames(audio))
+    if not segments:
+        logger.info(f"🔇 No speech in {original_seconds:.1f}s recording")
+        return None
+
+    frame = TARGET_SR * FRAME_MS // 1000
+    gap = np.zeros(TARGET_SR * JOIN_GAP_MS // 1000, dtype=np.float32)
+    pieces = []
+    for start, end in segments:
+        if pieces:
+            pieces.append(gap)
+        pieces.append(audio[start * frame:end * frame])
+    speech = np.concatenate(pieces)[: int(MAX_SECONDS * TARGET_SR)]
+
+    logger.info(
+        f"✂️ Preprocessed audio: {original_seconds:.1f}s -> {len(speech) / TARGET_SR:.1f}s "
+        f"({len(segments)} segment(s))"
+    )
+    return speech
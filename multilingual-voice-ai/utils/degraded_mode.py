@@ -0,0 +1,137 @@
+import io
+import logging
+import threading
+import time
+from typing import Dict
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing backend for a while instead of retrying on every call
+
+    closed    -> calls go through; failure_threshold consecutive failures opens it
+    open      -> calls are refused until reset_timeout_s has passed
+    half_open -> exactly one probe call is let through; success closes, failure reopens
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout_s: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout_s:
+                self.state = "half_open"
+                self.probe_in_flight = False
+            if self.state == "half_open" and not self.probe_in_flight:
+                self.probe_in_flight = True
+                logger.info(f"🔌 {self.name}: half-open, probing")
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != "closed":
+                logger.info(f"✅ {self.name}: recovered, circuit closed")
+            self.state = "closed"
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"⚠️ {self.name}: circuit open for {self.reset_timeout_s}s")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.probe_in_flight = False
+
+    def healthy(self) -> bool:
+        return self.state == "closed"
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures}
+
+
+tts_breaker = CircuitBreaker("TTS")
+whisper_breaker = CircuitBreaker("Whisper")
+
+# Apology played when a reply can't be synthesized
+FALLBACK_TEXTS = {
+    "hindi": "माफ कीजिए, अभी जवाब देने में परेशानी हो रही है। कृपया थोड़ी देर बाद कोशिश करें।",
+    "english": "Sorry, we are having trouble right now. Please try again in a little while.",
+}
+
+# Twilio <Say> voices used while TTS is unhealthy
+SAY_VOICES = {
+    "hindi": ("Polly.Aditi", "hi-IN"),
+    "english": ("Polly.Aditi", "en-IN"),
+    "tamil": ("Google.ta-IN-Standard-A", "ta-IN"),
+    "telugu": ("Google.te-IN-Standard-A", "te-IN"),
+    "kannada": ("Google.kn-IN-Standard-A", "kn-IN"),
+}
+
+# language -> WAV bytes, rendered once and kept in memory
+fallback_clips: Dict[str, bytes] = {}
+
+
+def render_tone(duration: float = 1.0, sample_rate: int = 22050) -> bytes:
+    """Last-resort clip: a short soft tone"""
+    t = np.arange(int(sample_rate * duration)) / sample_rate
+    audio = (0.3 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    buffer = io.BytesIO()
+    sf.write(buffer, audio, sample_rate, format="WAV")
+    return buffer.getvalue()
+
+
+def register_fallback_clip(language: str, wav_bytes: bytes):
+    fallback_clips[language] = wav_bytes
+
+
+def _clip_language(language: str) -> str:
+    if language not in fallback_clips:
+        language = "default" if "default" in fallback_clips else next(iter(fallback_clips))
+    return language
+
+
+def fallback_clip_pcm(language: str, sample_rate: int) -> bytes:
+    """
+    The fallback clip as raw 16-bit mono PCM at sample_rate, for streams
+    whose WAV header has already been sent
+    """
+    audio, rate = sf.read(io.BytesIO(fallback_clips[_clip_language(language)]), dtype="float32", always_2d=True)
+    audio = audio.mean(axis=1)
+    if rate != sample_rate:
+        # Linear resample; the clips are short and only played on failure
+        t = np.arange(int(len(audio) * sample_rate / rate)) / sample_rate
+        audio = np.interp(t, np.arange(len(audio)) / rate, audio)
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def say_attrs(language: str) -> str:
+    voice, lang = SAY_VOICES.get(language, SAY_VOICES["english"])
+    return f'voice="{voice}" language="{lang}"'
+
+
+def status() -> dict:
+    return {
+        "tts": tts_breaker.stats(),
+        "whisper": whisper_breaker.stats(),
+        "fallback_clips": sorted(fallback_clips),
+    }
+
+
+register_fallback_clip("default", render_tone())
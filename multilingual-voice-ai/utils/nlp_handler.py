@@ -14,6 +14,13 @@ except Exception as e:
     logger.error(f"❌ Error loading NLP models: {e}")
     sentiment_pipeline = None
 
+# Known places (also used to bias Whisper towards these spellings)
+LOCATION_KEYWORDS = [
+    "big bazaar", "forum mall", "brigade road", "mg road", "majestic",
+    "electronic city", "whitefield", "koramangala", "indiranagar",
+    "marathahalli", "silk board", "btm layout", "jayanagar"
+]
+
 async def extract_intent_and_entities(text: str, language: str) -> Tuple[str, Dict]:
     """
     Extract intent and entities from transcribed text
@@ -50,13 +57,7 @@ async def extract_intent_and_entities(text: str, language: str) -> Tuple[str, Di
         entities = {}
         
         # Extract locations (simple approach)
-        location_keywords = [
-            "big bazaar", "forum mall", "brigade road", "mg road", "majestic",
-            "electronic city", "whitefield", "koramangala", "indiranagar",
-            "marathahalli", "silk board", "btm layout", "jayanagar"
-        ]
-        
-        for location in location_keywords:
+        for location in LOCATION_KEYWORDS:
             if location in text_lower:
                 entities["location"] = location
                 break
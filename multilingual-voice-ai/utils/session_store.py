@@ -0,0 +1,77 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CallSession:
+    """State carried across the turns of one phone call"""
+
+    def __init__(self, call_sid: str, caller: str):
+        self.call_sid = call_sid
+        self.caller = caller
+        self.language: Optional[str] = None   # e.g. "hindi", skips language ID on follow-ups
+        self.entities: Dict = {}              # last location / bus_number / time mentioned
+        self.answers: Dict = {}               # (intent, location, bus_number) -> reply text
+        self.tts_config: Optional[dict] = None
+        self.turns = 0
+        self.last_seen = time.monotonic()
+
+    def merge_entities(self, entities: Dict) -> Dict:
+        """Fill in what a follow-up question leaves out ("and the fare?")"""
+        merged = {**self.entities, **{k: v for k, v in entities.items() if v}}
+        self.entities = merged
+        return merged
+
+
+class SessionStore:
+    """
+    In-memory CallSid -> CallSession map with TTL expiry and LRU eviction
+    """
+
+    def __init__(self, max_sessions: int = 5000, ttl_s: float = 900):
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self.sessions: "OrderedDict[str, CallSession]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_create(self, call_sid: str, caller: str = "Unknown") -> CallSession:
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            session = self.sessions.get(call_sid)
+            if session is None:
+                session = CallSession(call_sid, caller)
+                self.sessions[call_sid] = session
+                if len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+            else:
+                self.sessions.move_to_end(call_sid)
+            session.last_seen = now
+            return session
+
+    def end(self, call_sid: str):
+        with self.lock:
+            self.sessions.pop(call_sid, None)
+
+    def _expire(self, now: float):
+        # Oldest-first order means we can stop at the first live session
+        while self.sessions:
+            sid, session = next(iter(self.sessions.items()))
+            if now - session.last_seen < self.ttl_s:
+                break
+            self.sessions.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"active": len(self.sessions), "max": self.max_sessions, "ttl_s": self.ttl_s}
+
+
+sessions = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX", "5000")),
+    ttl_s=float(os.getenv("SESSION_TTL_S", "900")),
+)
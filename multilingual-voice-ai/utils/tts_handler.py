@@ -2,10 +2,18 @@ import torch
 from transformers import AutoModel, AutoTokenizer
 import soundfile as sf
 import logging
-import os
 import uuid
 from pathlib import Path
 import asyncio
+import io
+import re
+import struct
+import time
+import numpy as np
+from typing import Dict, List
+from utils.degraded_mode import (
+    tts_breaker, FALLBACK_TEXTS, register_fallback_clip, fallback_clip_pcm
+)
 
 logger = logging.getLogger(__name__)
 
@@ -23,93 +31,227 @@ except Exception as e:
     logger.error(f"❌ Error loading TTS model: {e}")
     tts_model = None
 
-async def generate_speech(text: str, language: str, base_url: str) -> str:
-    """
-    Generate speech audio from text
-    Returns: URL to the generated audio file
-    """
-    try:
-        if not tts_model:
-            logger.warning("TTS model not available, using fallback")
-            return create_fallback_audio(text, base_url)
-        
-        # Choose speaker and style based on language
-        speaker_mapping = {
-            "hindi": {"speaker_id": 16, "emotion_id": 0},  # PAN_M, ALEXA style
-            "english": {"speaker_id": 8, "emotion_id": 0},
-            "default": {"speaker_id": 16, "emotion_id": 0}
-        }
-        
-        config = speaker_mapping.get(language, speaker_mapping["default"])
-        
-        # Generate unique filename
-        audio_id = str(uuid.uuid4())
-        filename = f"response_{audio_id}.wav"
-        filepath = os.path.join("static", "audio", filename)
-        
-        # Run TTS in thread pool
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None, 
-            lambda: generate_tts_sync(text, config, filepath)
-        )
-        
-        # Return URL for Twilio to access
-        audio_url = f"{base_url.rstrip('/')}/static/audio/{filename}"
-        logger.info(f"🔊 Audio generated: {audio_url}")
-        return audio_url
-        
-    except Exception as e:
-        logger.error(f"❌ TTS generation error: {e}")
-        return create_fallback_audio(text, base_url)
+# Choose speaker and style based on language
+speaker_mapping = {
+    "hindi": {"speaker_id": 16, "emotion_id": 0},  # PAN_M, ALEXA style
+    "english": {"speaker_id": 8, "emotion_id": 0},
+    "default": {"speaker_id": 16, "emotion_id": 0}
+}
 
-def generate_tts_sync(text: str, config: dict, filepath: str):
-    """Synchronous TTS generation"""
+def generate_tts_sync(text: str, config: dict) -> bytes:
+    """Synchronous TTS generation, returns WAV bytes"""
     try:
-        inputs = tts_tokenizer(text=text, return_tensors="pt").to(tts_model.device)
+        # All sentences in one padded forward pass
+        chunks = synthesize_batch(split_sentences(text), config)
+        audio = np.concatenate(chunks)
+        buffer = io.BytesIO()
+        sf.write(buffer, audio, tts_model.config.sampling_rate, format="WAV")
         
-        with torch.no_grad():
-            outputs = tts_model(
-                inputs['input_ids'],
-                speaker_id=config["speaker_id"],
-                emotion_id=config["emotion_id"]
-            )
-        
-        # Save audio
-        audio = outputs.waveform.squeeze().cpu().numpy()
-        sf.write(filepath, audio, tts_model.config.sampling_rate)
-        
-        logger.info(f"✅ TTS audio saved: {filepath}")
+        logger.info(f"✅ TTS audio generated ({len(audio)} samples)")
+        return buffer.getvalue()
         
     except Exception as e:
         logger.error(f"❌ Sync TTS error: {e}")
         raise
 
-def create_fallback_audio(text: str, base_url: str) -> str:
-    """Create a simple fallback when TTS fails"""
+def split_sentences(text: str) -> List[str]:
+    """Split a reply into sentences (handles the Devanagari danda too)"""
+    parts = [p.strip() for p in re.split(r"(?<=[.!?।])\s+", text)]
+    return [p for p in parts if p] or [text]
+
+def synthesize_batch(sentences: List[str], config: dict) -> List[np.ndarray]:
+    """
+    Synthesize several sentences as one padded batch
+    Returns: one float32 waveform per sentence, padding removed
+    """
+    inputs = tts_tokenizer(text=sentences, padding=True, return_tensors="pt").to(tts_model.device)
+    
+    with torch.no_grad():
+        outputs = tts_model(
+            inputs["input_ids"],
+            attention_mask=inputs.get("attention_mask"),
+            speaker_id=config["speaker_id"],
+            emotion_id=config["emotion_id"]
+        )
+    
+    waveforms = outputs.waveform.cpu().numpy()
+    if waveforms.ndim == 1:
+        waveforms = waveforms[None, :]
+    lengths = getattr(outputs, "sequence_lengths", None)
+    if lengths is None:
+        return [np.trim_zeros(w, "b") for w in waveforms]
+    return [w[:int(n)] for w, n in zip(waveforms, lengths.tolist())]
+
+
+class TTSBatcher:
+    """
+    Merges sentences from concurrent calls into shared forward passes.
+    Requests arriving within max_wait_s of each other (and using the same
+    speaker config) are synthesized together, up to max_batch sentences.
+    A reply's first sentence (head=True) closes the window at once and is
+    synthesized ahead of any queued non-head sentences, so time to first
+    audio does not grow with reply length.
+    """
+    
+    def __init__(self, max_batch: int = 8, max_wait_s: float = 0.02):
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_s
+        self.queue = None
+        self.worker = None
+    
+    async def synthesize(self, sentence: str, config: dict, head: bool = False) -> np.ndarray:
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.create_task(self.run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((sentence, config, future, head))
+        return await future
+    
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        pending = []  # taken off the queue, not yet synthesized
+        while True:
+            if not pending:
+                pending.append(await self.queue.get())
+            deadline = loop.time() + self.max_wait_s
+            while len(pending) < self.max_batch and not any(item[3] for item in pending):
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            while not self.queue.empty():
+                pending.append(self.queue.get_nowait())
+            
+            # Waiting head sentences go first, without the rest of their replies
+            heads = [item for item in pending if item[3]]
+            batch = (heads or pending)[:self.max_batch]
+            pending = [item for item in pending if item not in batch]
+            
+            # One forward pass per speaker config in this window
+            groups: Dict[tuple, list] = {}
+            for item in batch:
+                groups.setdefault(tuple(sorted(item[1].items())), []).append(item)
+            for items in groups.values():
+                try:
+                    waveforms = await loop.run_in_executor(
+                        None, synthesize_batch, [i[0] for i in items], items[0][1]
+                    )
+                    for (_, _, future, _), audio in zip(items, waveforms):
+                        if not future.done():
+                            future.set_result(audio)
+                except Exception as e:
+                    for _, _, future, _ in items:
+                        if not future.done():
+                            future.set_exception(e)
+
+tts_batcher = TTSBatcher()
+
+# stream_id -> {"queue": asyncio.Queue of PCM chunks (None ends it), "created": time,
+#               "task": producer task, result False if synthesis failed}
+pending_streams: Dict[str, dict] = {}
+STREAM_TTL_S = 120
+
+def wav_stream_header(sample_rate: int) -> bytes:
+    """16-bit mono WAV header with 'unknown' sizes so it can be streamed"""
+    unknown = 0xFFFFFFFF
+    return (
+        b"RIFF" + struct.pack("<I", unknown) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+        + b"data" + struct.pack("<I", unknown)
+    )
+
+def to_pcm16(audio: np.ndarray) -> bytes:
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+async def produce_stream(sentences: List[str], config: dict, queue: asyncio.Queue, language: str = "default"):
+    """
+    Synthesize sentences in order, pushing each as soon as it is ready.
+    On failure the caller is already listening, so finish with the
+    language's pre-rendered apology clip instead of silence
+    Returns: False if synthesis failed and the fallback clip was sent
+    """
     try:
-        # For demo purposes, create a simple tone (replace with actual TTS service)
-        import numpy as np
-        
-        # Generate a simple beep sound as placeholder
-        duration = min(len(text) * 0.1, 5.0)  # Max 5 seconds
-        sample_rate = 22050
-        t = np.linspace(0, duration, int(sample_rate * duration))
-        frequency = 440  # A4 note
-        audio = 0.3 * np.sin(2 * np.pi * frequency * t)
-        
-        # Save as WAV
-        audio_id = str(uuid.uuid4())
-        filename = f"fallback_{audio_id}.wav"
-        filepath = os.path.join("static", "audio", filename)
-        
-        sf.write(filepath, audio, sample_rate)
-        
-        audio_url = f"{base_url.rstrip('/')}/static/audio/{filename}"
-        logger.info(f"🔊 Fallback audio created: {audio_url}")
-        return audio_url
-        
+        # Submit every sentence up front: the first is synthesized on its own
+        # so playback can start, the rest share batches (across calls too)
+        tasks = [
+            asyncio.ensure_future(tts_batcher.synthesize(s, config, head=(i == 0)))
+            for i, s in enumerate(sentences)
+        ]
+        for task in tasks:
+            await queue.put(to_pcm16(await task))
+        tts_breaker.record_success()
+        return True
     except Exception as e:
-        logger.error(f"❌ Fallback audio error: {e}")
-        # Return empty string to use TTS only
-        return ""
+        logger.error(f"❌ Streaming TTS error: {e}")
+        tts_breaker.record_failure()
+        try:
+            await queue.put(fallback_clip_pcm(language, tts_model.config.sampling_rate))
+        except Exception as e:
+            logger.error(f"❌ Fallback clip error: {e}")
+        return False
+    finally:
+        await queue.put(None)
+
+def start_speech_stream(text: str, language: str, config: dict = None) -> str:
+    """
+    Start synthesizing in the background, sentence by sentence
+    Returns: stream id for stream_audio, or None when TTS is unhealthy
+    """
+    if not tts_model or not tts_breaker.allow():
+        logger.warning("TTS unavailable")
+        return None
+    
+    # Drop streams nobody fetched
+    now = time.monotonic()
+    for stale in [k for k, v in pending_streams.items() if now - v["created"] > STREAM_TTL_S]:
+        pending_streams.pop(stale, None)
+    
+    config = config or speaker_mapping.get(language, speaker_mapping["default"])
+    stream_id = str(uuid.uuid4())
+    queue = asyncio.Queue()
+    task = asyncio.create_task(produce_stream(split_sentences(text), config, queue, language))
+    pending_streams[stream_id] = {"queue": queue, "created": now, "task": task}
+    return stream_id
+
+async def generate_speech_stream(text: str, language: str, base_url: str, config: dict = None) -> str:
+    """
+    Start synthesizing and return a URL that streams the audio
+    sentence by sentence, so playback can begin after the first one
+    Returns: URL to the streaming audio response, or None when TTS is
+    unhealthy and the caller should fall back to TwiML <Say>
+    """
+    stream_id = start_speech_stream(text, language, config)
+    if stream_id is None:
+        return None
+    
+    audio_url = f"{base_url.rstrip('/')}/tts/stream/{stream_id}.wav"
+    logger.info(f"🔊 Streaming audio: {audio_url}")
+    return audio_url
+
+async def stream_audio(stream_id: str):
+    """Async generator of WAV bytes for a stream started by generate_speech_stream"""
+    stream = pending_streams.pop(stream_id, None)
+    if stream is None:
+        return
+    yield wav_stream_header(tts_model.config.sampling_rate)
+    while True:
+        chunk = await stream["queue"].get()
+        if chunk is None:
+            break
+        yield chunk
+
+def prerender_fallback_clips():
+    """Render the apology clips once with the real voice while TTS is healthy"""
+    for language, text in FALLBACK_TEXTS.items():
+        try:
+            config = speaker_mapping.get(language, speaker_mapping["default"])
+            register_fallback_clip(language, generate_tts_sync(text, config))
+        except Exception as e:
+            logger.error(f"❌ Could not pre-render {language} fallback clip: {e}")
+    logger.info("🔊 Fallback clips ready")
+
+if tts_model:
+    prerender_fallback_clips()
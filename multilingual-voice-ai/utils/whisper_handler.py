@@ -2,7 +2,13 @@ import whisper
 import torch
 import logging
 import asyncio
+import threading
+from collections import OrderedDict
 from pathlib import Path
+from utils.audio_preprocess import preprocess_audio
+from utils.business_logic import SAMPLE_BUS_DATA
+from utils.nlp_handler import LOCATION_KEYWORDS
+from utils.degraded_mode import whisper_breaker
 
 logger = logging.getLogger(__name__)
 
@@ -15,43 +21,120 @@ except Exception as e:
     logger.error(f"❌ Error loading Whisper model: {e}")
     model = None
 
-async def transcribe_audio(audio_path: str):
+# Map whisper language codes to our system
+lang_mapping = {
+    "hi": "hindi",
+    "en": "english",
+    "te": "telugu",
+    "ta": "tamil",
+    "kn": "kannada"
+}
+
+# Caller number -> [whisper language code, calls since last detection]
+caller_languages = OrderedDict()
+caller_lock = threading.Lock()
+MAX_CALLERS = 10000
+AFFINITY_MIN_PROB = 0.7    # Only remember confident detections
+AFFINITY_RECHECK = 5       # Re-run detection every N calls in case the caller switches
+
+# Vocabulary bias: bus numbers and place names as Whisper's initial prompt
+all_buses = sorted({bus for route in SAMPLE_BUS_DATA["routes"].values() for bus in route["buses"]})
+VOCAB_PROMPT = (
+    f"Bus number {', '.join(all_buses)}. "
+    f"{', '.join(place.title() for place in LOCATION_KEYWORDS)}."
+)
+
+
+def detect_language(audio) -> tuple:
+    """
+    Language ID on the first 30 s, restricted to the languages we support
+    Returns: (whisper_language_code, probability)
+    """
+    segment = whisper.pad_or_trim(audio)
+    mel = whisper.log_mel_spectrogram(segment, model.dims.n_mels).to(model.device)
+    _, probs = model.detect_language(mel)
+    supported = {code: probs.get(code, 0.0) for code in lang_mapping}
+    total = sum(supported.values()) or 1.0
+    code = max(supported, key=supported.get)
+    return code, supported[code] / total
+
+
+def resolve_language(audio, caller: str = None) -> str:
+    """
+    Use the caller's remembered language when we have one,
+    otherwise run the restricted language-ID pass
+    """
+    with caller_lock:
+        affinity = caller_languages.get(caller) if caller else None
+        if affinity and affinity[1] < AFFINITY_RECHECK:
+            affinity[1] += 1
+            caller_languages.move_to_end(caller)
+            logger.info(f"🌐 Language from caller affinity: {affinity[0]}")
+            return affinity[0]
+
+    code, prob = detect_language(audio)
+    logger.info(f"🌐 Detected language: {code} (p={prob:.2f})")
+    if caller and prob >= AFFINITY_MIN_PROB:
+        with caller_lock:
+            caller_languages[caller] = [code, 0]
+            caller_languages.move_to_end(caller)
+            if len(caller_languages) > MAX_CALLERS:
+                caller_languages.popitem(last=False)
+    return code
+
+
+language_codes = {name: code for code, name in lang_mapping.items()}
+
+
+def transcribe_sync(audio, caller: str = None, language: str = None) -> dict:
+    """Language ID (unless already known for this call) + explicit-language decode"""
+    code = language_codes.get(language) or resolve_language(audio, caller)
+    result = model.transcribe(
+        audio,
+        language=code,              # Skip Whisper's own detection pass
+        initial_prompt=VOCAB_PROMPT,
+        temperature=0.0,            # Greedy, no temperature-fallback re-decodes
+        condition_on_previous_text=False,
+        fp16=torch.cuda.is_available()
+    )
+    result["language"] = code
+    return result
+
+
+async def transcribe_audio(audio_path: str, caller: str = None, language: str = None):
     """
     Transcribe audio file using Whisper
-    Returns: (transcript_text, detected_language)
+    language: known language for this call (e.g. "hindi") to skip detection
+    Returns: (transcript_text, detected_language); detected_language is
+    None when nothing was recognised (silence or a Whisper failure)
     """
     try:
         if not model:
             raise Exception("Whisper model not loaded")
-        
-        # Run transcription in thread pool to avoid blocking
+
+        # Run preprocessing and transcription in thread pool to avoid blocking
         loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None, lambda: model.transcribe(
-                audio_path, 
-                language=None,  # Auto-detect language
-                fp16=torch.cuda.is_available()
-            )
-        )
-        
+        audio = await loop.run_in_executor(None, preprocess_audio, audio_path)
+        if audio is None:
+            # Silent recording: nothing for Whisper to do
+            return "", None
+
+        if not whisper_breaker.allow():
+            raise Exception("Whisper circuit open")
+        try:
+            result = await loop.run_in_executor(None, lambda: transcribe_sync(audio, caller, language))
+        except Exception:
+            whisper_breaker.record_failure()
+            raise
+        whisper_breaker.record_success()
+
         transcript = result["text"].strip()
-        detected_language = result["language"]
-        
-        # Map whisper language codes to our system
-        lang_mapping = {
-            "hi": "hindi",
-            "en": "english", 
-            "te": "telugu",
-            "ta": "tamil",
-            "kn": "kannada"
-        }
-        
-        language = lang_mapping.get(detected_language, "english")
-        
+        language = lang_mapping.get(result["language"], "english")
+
         logger.info(f"📝 Transcription: '{transcript}' (Language: {language})")
         return transcript, language
-        
+
     except Exception as e:
         logger.error(f"❌ Transcription error: {e}")
-        # Fallback
-        return "मुझे समझ नहीं आया, कृपया दोबारा बोलिए", "hindi"
+        # Fallback: apology text, but no language to remember for the call
+        return "मुझे समझ नहीं आया, कृपया दोबारा बोलिए", None